@@ -1,17 +1,38 @@
+import argparse
 import asyncio
+import bisect
+import heapq
 import platform
 import pygame
 import sys
+import os
 import random
+import socket
+import subprocess
 from PIL import Image
 import math
+import json
+try:
+    import numpy as np
+except ImportError:  # moteur vectorisé optionnel
+    np = None
+import time
+import mmap
+import struct
+import zlib
+import weakref
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # ────────────────────────────────────────────────
 # CONFIGURATION GÉNÉRALE
 # ────────────────────────────────────────────────
 WIDTH, HEIGHT = 800, 600
 WORLD_WIDTH   = 3200
-FPS           = 60
+FPS           = 60    # Plafond d'affichage
+SIM_HZ        = 60    # Fréquence fixe de la simulation
+SIM_DT        = 1 / SIM_HZ
+MAX_SIM_STEPS = 5     # Rattrapage max par frame affichée (évite la spirale)
 GRAVITY       = 0.8
 DESPAWN_MARGIN = 360  # Augmenté (1.5x)
 SPAWN_MARGIN = 150    # Augmenté (1.5x)
@@ -24,6 +45,7 @@ INVULN_FRAMES       = 30
 KNOCKBACK_X         = 6
 KNOCKBACK_Y         = -4
 BULLET_SPEED        = 10
+BULLET_LIFETIME     = 8 * SIM_HZ  # ticks ; au-delà la balle est retirée même dans le monde
 
 # Shooter ennemi
 SHO_HP, SHO_DMG     = 3, 1
@@ -37,7 +59,6 @@ SHO_SAFE_DIST       = 120
 MEL_HP, MEL_DMG     = 4, 1
 MEL_SPEED_RANGE     = (1, 3)
 MEL_JUMP_CD         = 800
-MEL_LOOKAHEAD       = 36  # Augmenté (1.5x)
 MEL_DROP_H          = 50
 MEL_MIN_DIST        = 20
 
@@ -52,6 +73,7 @@ TREE_NEAR = (60, 114, 66)
 C_BG       = (126, 200, 235)
 C_PLATFORM = (139,  69,  19)
 C_PLAYER   = ( 20,  20, 255)
+C_PLAYER2  = (240, 140,  20)  # Partenaire en co-op
 C_SHOOTER  = (220,  40,  40)
 C_MELEE    = ( 40, 220,  40)
 C_VEHICLE  = (  0,   0,   0)
@@ -60,84 +82,661 @@ C_BAR_BG   = ( 40,  40,  40)
 C_BAR      = (  0, 255,   0)
 C_ARROW    = (255, 255,   0)
 
+# ────────────────────────────────────────────────
+# LIGNE DE COMMANDE
+# ────────────────────────────────────────────────
+# Un seul parseur : les options qui règlent le module à l'import (fenêtre,
+# moteur, rendu, niveau, IA...) sont déclarées ici et lues une fois par
+# parse_known_args() ; le lancement ajoute les siennes et refait parse_args().
+# Pas d'abréviations : --dirty ou --num seraient acceptés puis ignorés ici.
+parser = argparse.ArgumentParser(description="Parallax Beat'em Up", allow_abbrev=False)
+parser.add_argument("--headless", action="store_true", help="simulation sans fenêtre")
+parser.add_argument("--numpy", action="store_true", help="moteur vectorisé pour les ennemis")
+parser.add_argument("--dirty-rects", action="store_true",
+                    help="rendu partiel quand la caméra est fixe (arènes)")
+parser.add_argument("--level", metavar="DOSSIER", help="niveau découpé en tronçons")
+parser.add_argument("--renderer", choices=("surface", "sdl2"),
+                    help="backend de rendu : blits logiciels (défaut) ou Renderer/Texture SDL2")
+parser.add_argument("--ai-budget", type=float, metavar="MS",
+                    help="IA hors champ : budget par tick en jeu (défaut : illimité)")
+parser.add_argument("--no-ai-lod", action="store_true", help="IA complète pour tous les ennemis")
+parser.add_argument("--profile", action="store_true",
+                    help="profileur actif dès le lancement (F3 : overlay, F4 : export)")
+parser.add_argument("--record", metavar="FICHIER",
+                    help="enregistre graine et entrées pour un rejeu à l'identique")
+parser.add_argument("--replay", nargs="+", metavar="FICHIER",
+                    help="rejoue des enregistrements (mesurés comme des bancs d'essai)")
+bench_option = parser.add_argument("--bench", nargs="*", metavar="SCÉNARIO", help="bancs d'essai")
+parser.add_argument("--balance", type=int, metavar="PARTIES",
+                    help="équilibrage Monte-Carlo : parties par arène et par échelle")
+parser.add_argument("--net-test", action="store_true",
+                    help="co-op hôte + client en local, sans fenêtre (débit, pertes, cohérence)")
+parser.add_argument("--export-level", metavar="DOSSIER",
+                    help="écrit le monde par défaut au format niveau")
+parser.add_argument("--bake", action="store_true",
+                    help="pré-cuit les animations dans le paquet d'images puis quitte")
+cli_args = parser.parse_known_args()[0]
+
+# Sans fenêtre (tests, profilage, bancs d'essai) : pilote vidéo SDL factice.
+# Importé comme module (test, profileur), on l'est aussi sauf BEAT_HEADLESS=0.
+HEADLESS = (cli_args.headless or cli_args.bench is not None or bool(cli_args.replay) or
+            bool(cli_args.balance) or cli_args.net_test or bool(cli_args.export_level) or
+            os.environ.get("BEAT_HEADLESS", "1" if __name__ != "__main__" else "0") == "1")
+if HEADLESS:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+USE_NUMPY = cli_args.numpy or os.environ.get("BEAT_NUMPY") == "1"
+if USE_NUMPY and np is None:
+    print("NumPy introuvable : moteur Python pour les ennemis")
+    USE_NUMPY = False
+
+# Rendu : "surface" (blits logiciels, défaut) ou "sdl2" (Renderer/Texture de
+# pygame._sdl2, pilote logiciel de SDL)
+RENDERER = cli_args.renderer or os.environ.get("BEAT_RENDERER", "surface")
+
 pygame.init()
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Parallax Beat'em Up")
+if RENDERER == "sdl2":
+    from pygame._sdl2 import video
+    window = video.Window("Parallax Beat'em Up", size=(WIDTH, HEIGHT))
+    # Pas de display.set_mode : `screen` reste une image hors fenêtre
+    # (écran de chargement), envoyée en texture à chaque affichage
+    screen = pygame.Surface((WIDTH, HEIGHT))
+else:
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Parallax Beat'em Up")
 clock = pygame.time.Clock()
 font = pygame.font.SysFont(None, 48)  # Augmenté pour visibilité
 big_font = pygame.font.SysFont(None, 48)
 hit_font = pygame.font.SysFont(None, 72)  # Augmenté pour visibilité
 
+# ────────────────────────────────────────────────
+# LISTE DE DESSIN & BACKENDS DE RENDU
+# ────────────────────────────────────────────────
+# Les draw() n'écrivent plus sur l'écran : ils remplissent une DrawList
+# (image + position [+ zone source], ou FILL + couleur + zone) que le backend
+# exécute en fin de phase. "surface" : images au format de l'écran,
+# animations rangées dans un atlas, un Surface.blits() par suite d'images.
+# "sdl2" : une texture par page d'atlas (ou par image isolée), dessinées par
+# le Renderer logiciel de SDL. Côté "surface", set_scale() (gouverneur de
+# qualité) fait dessiner à une résolution interne réduite, agrandie d'un bloc
+# par present() ; le Renderer logiciel y perdrait plus qu'il ne gagne (cible
+# intermédiaire puis copie étirée) et reste à pleine résolution.
+FILL = object()  # étiquette d'un rectangle plein dans DrawList.ops
+
+class DrawList:
+    __slots__ = ("ops",)
+
+    def __init__(self):
+        self.ops = []
+
+    def blit(self, surf, dest, area=None):
+        self.ops.append((surf, dest, area))
+
+    def rect(self, color, rect=None):  # rect None : tout l'écran
+        self.ops.append((FILL, color, rect))
+
+    def blits(self, images, positions):  # lot d'images sans zone source
+        self.ops.extend(zip(images, positions, [None] * len(images)))
+
+ATLAS_PAGE = 1024
+
+class SpriteAtlas:
+    # Rangement en étagères ; chaque image devient une sous-surface d'une page
+    def __init__(self):
+        self.pages = []
+        self.slots = {}      # sous-surface -> (indice de page, zone)
+        self.dirty = set()   # pages modifiées depuis le dernier envoi en texture
+        self.shelf = (0, 0, 0)  # x, y, hauteur de l'étagère courante
+
+    def add(self, surf):
+        w, h = surf.get_size()
+        if w > ATLAS_PAGE or h > ATLAS_PAGE:
+            return backend.prepare(surf)
+        x, y, shelf_h = self.shelf
+        if x + w > ATLAS_PAGE:
+            x, y, shelf_h = 0, y + shelf_h, 0
+        if not self.pages or y + h > ATLAS_PAGE:
+            self.pages.append(backend.prepare(pygame.Surface((ATLAS_PAGE, ATLAS_PAGE), pygame.SRCALPHA)))
+            x, y, shelf_h = 0, 0, 0
+        index = len(self.pages) - 1
+        area = pygame.Rect(x, y, w, h)
+        # Page vide + BLEND_RGBA_MAX : copie exacte, alpha compris
+        self.pages[index].blit(surf, area, special_flags=pygame.BLEND_RGBA_MAX)
+        sprite = self.pages[index].subsurface(area)
+        self.slots[sprite] = (index, area)
+        self.dirty.add(index)
+        self.shelf = (x + w, y, max(shelf_h, h))
+        return sprite
+
+class SurfaceBackend:
+    name = "surface"
+    scalable = True
+
+    def __init__(self):
+        self.scale = 1.0
+        self.low = None                            # image à la résolution interne
+        self.scaled = weakref.WeakKeyDictionary()  # image -> sa version réduite
+
+    def prepare(self, surf):
+        return surf.convert_alpha() if surf.get_flags() & pygame.SRCALPHA else surf.convert()
+
+    def refresh(self, surf):  # image redessinée en place : la copie réduite est périmée
+        self.scaled.pop(surf, None)
+
+    def set_scale(self, scale):
+        self.scale = scale
+        self.low = None if scale == 1 else pygame.Surface((round(WIDTH * scale), round(HEIGHT * scale))).convert()
+        self.scaled = weakref.WeakKeyDictionary()
+
+    def draw(self, out, target=None):
+        if target is None and self.low is not None:
+            return self.draw_scaled(out)
+        target = target or screen
+        batch = []
+        for surf, dest, area in out.ops:
+            if surf is FILL:
+                if batch:
+                    target.blits(batch, False)
+                    batch = []
+                target.fill(dest, area)  # couleur, zone
+            elif area is None:
+                batch.append((surf, dest))
+            else:
+                batch.append((surf, dest, area))
+        if batch:
+            target.blits(batch, False)
+        if PROFILER.enabled:
+            PROFILER.blits += len(out.ops)
+        out.ops.clear()
+
+    def draw_scaled(self, out):
+        # Positions et zones à l'échelle, images réduites une fois (lissées) puis gardées
+        s, target, scaled = self.scale, self.low, self.scaled
+        batch = []
+        for surf, dest, area in out.ops:
+            if surf is FILL:
+                if batch:
+                    target.blits(batch, False)
+                    batch = []
+                target.fill(dest, area and scale_rect(area, s))
+                continue
+            small = scaled.get(surf)
+            if small is None:
+                w, h = surf.get_size()
+                small = scaled[surf] = pygame.transform.smoothscale(surf, (max(1, round(w * s)),
+                                                                           max(1, round(h * s))))
+            pos = (int(dest[0] * s), int(dest[1] * s))
+            batch.append((small, pos) if area is None else (small, pos, scale_rect(area, s)))
+        if batch:
+            target.blits(batch, False)
+        if PROFILER.enabled:
+            PROFILER.blits += len(out.ops)
+        out.ops.clear()
+
+    def present(self, rects=None):
+        if self.low is not None:
+            pygame.transform.scale(self.low, (WIDTH, HEIGHT), screen)
+            rects = None
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+    def present_surface(self, surf):  # écran de chargement : déjà sur l'écran
+        pygame.display.flip()
+
+class TextureBackend:
+    name = "sdl2"
+    scalable = False
+    scale = 1.0
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.pages = []
+        self.textures = weakref.WeakKeyDictionary()  # images hors atlas
+
+    def prepare(self, surf):  # pas de mode vidéo : la texture fait la conversion
+        return surf
+
+    def texture(self, surf):
+        tex = self.textures.get(surf)
+        if tex is None:
+            tex = self.textures[surf] = video.Texture.from_surface(self.renderer, surf)
+            if PROFILER.enabled:
+                PROFILER.surfaces += 1
+        return tex
+
+    def refresh(self, surf):  # image redessinée en place : même texture, pixels recopiés
+        tex = self.textures.get(surf)
+        if tex is not None:
+            tex.update(surf)
+
+    def upload_atlas(self):
+        for index in sorted(ATLAS.dirty):
+            tex = video.Texture.from_surface(self.renderer, ATLAS.pages[index])
+            if index < len(self.pages):
+                self.pages[index] = tex
+            else:
+                self.pages.append(tex)
+        ATLAS.dirty.clear()
+
+    def draw(self, out, target=None):
+        if ATLAS.dirty:
+            self.upload_atlas()
+        renderer = self.renderer
+        slots = ATLAS.slots
+        for surf, dest, area in out.ops:
+            if surf is FILL:
+                renderer.draw_color = pygame.Color(dest)
+                if area is None:
+                    renderer.clear()
+                else:
+                    renderer.fill_rect(area)
+                continue
+            slot = slots.get(surf)
+            if slot is None:
+                tex = self.texture(surf)
+                src = area or surf.get_rect()
+            else:
+                tex = self.pages[slot[0]]
+                src = area.move(slot[1].topleft) if area else slot[1]
+            tex.draw(src, (int(dest[0]), int(dest[1]), src[2], src[3]))
+        if PROFILER.enabled:
+            PROFILER.blits += len(out.ops)
+        out.ops.clear()
+
+    def present(self, rects=None):
+        self.renderer.present()
+
+    def present_surface(self, surf):
+        video.Texture.from_surface(self.renderer, surf).draw()
+        self.renderer.present()
+
+def scale_rect(r, s):  # arrondi vers l'extérieur : pas de joint entre deux zones voisines
+    x, y = int(r[0] * s), int(r[1] * s)
+    return pygame.Rect(x, y, math.ceil((r[0] + r[2]) * s) - x, math.ceil((r[1] + r[3]) * s) - y)
+
+backend = TextureBackend(video.Renderer(window, accelerated=0)) if RENDERER == "sdl2" else SurfaceBackend()
+ATLAS = SpriteAtlas()
+draw_list = DrawList()
+
 # ────────────────────────────────────────────────
 # CHARGEMENT DES ANIMATIONS
 # ────────────────────────────────────────────────
-def load_gif_frames(gif_path, target_height=144):  # Augmenté à 144 pour personnages
+def decode_gif(gif_path, target_height=144):
     gif = Image.open(gif_path)
-    frames = []
-    durations = []
+    decoded = []
     for frame in range(gif.n_frames):
         gif.seek(frame)
         frame_image = gif.convert("RGBA")
         scale_factor = target_height / frame_image.height
         new_width = int(frame_image.width * scale_factor)
         frame_image = frame_image.resize((new_width, target_height), Image.LANCZOS)
-        mode = frame_image.mode
-        size = frame_image.size
-        data = frame_image.tobytes()
-        frame_surface = pygame.image.fromstring(data, size, mode)
-        frames.append(frame_surface)
-        duration = gif.info.get('duration', 100) / 1000
-        durations.append(duration)
+        decoded.append((frame_image.size, frame_image.tobytes(), gif.info.get('duration', 100)))
+    return decoded
+
+def decode_image(path, target_height):
+    img = Image.open(path).convert("RGBA")
+    new_width = int(img.width * target_height / img.height)
+    img = img.resize((new_width, target_height), Image.NEAREST)
+    return img.size, img.tobytes()
+
+def gif_surfaces(decoded):  # thread principal uniquement
+    frames = []
+    durations = []
+    for size, data, duration_ms in decoded:
+        frames.append(pygame.image.fromstring(data, size, "RGBA"))
+        durations.append(duration_ms / 1000)
     return frames, durations
 
-melee_walk_frames, melee_walk_durations = load_gif_frames("gifs/melee_walk.gif")
-melee_idle_frames, melee_idle_durations = load_gif_frames("gifs/melee_idle.gif")
-melee_2_walk_frames, melee_2_walk_durations = load_gif_frames("gifs/melee_2_walk.gif")
-melee_2_idle_frames, melee_2_idle_durations = load_gif_frames("gifs/melee_2_idle.gif")
-shooter_idle_frames, shooter_idle_durations = load_gif_frames("gifs/shooter_idle.gif")
-shooter_walk_frames, shooter_walk_durations = load_gif_frames("gifs/shooter_walk.gif")
-shooter_attack_frames, shooter_attack_durations = load_gif_frames("gifs/shooter_attack.gif")
-projectile_frames, projectile_durations = load_gif_frames("gifs/shooter_projectile.gif", target_height=36)  # Augmenté
+# ────────────────────────────────────────────────
+# PAQUET D'IMAGES PRÉ-CUIT (mmap, sans décodage)
+# ────────────────────────────────────────────────
+# `python "import pygame.py" --bake` écrit toutes les images RGBA déjà mises
+# à l'échelle dans un seul fichier. Au lancement on le mappe en mémoire et
+# les Surfaces pointent directement dedans (frombuffer). Une entrée absente
+# ou périmée (GIF modifié, autre hauteur) repasse par le décodage PIL. Le GIF
+# est reconnu à sa taille et sa date (un stat, pas de lecture au lancement).
+ANIMATION_SOURCES = [
+    ("melee_walk",     "gifs/melee_walk.gif",         144),
+    ("melee_idle",     "gifs/melee_idle.gif",         144),
+    ("melee_2_walk",   "gifs/melee_2_walk.gif",       144),
+    ("melee_2_idle",   "gifs/melee_2_idle.gif",       144),
+    ("shooter_idle",   "gifs/shooter_idle.gif",       144),
+    ("shooter_walk",   "gifs/shooter_walk.gif",       144),
+    ("shooter_attack", "gifs/shooter_attack.gif",     144),
+    ("projectile",     "gifs/shooter_projectile.gif", 36),   # Augmenté
+]
+BUNDLE_PATH  = "gifs/frames.bundle"
+BUNDLE_MAGIC = b"BEATFRM2"
+_BUNDLE_HEAD  = struct.Struct("<8sI")          # magic, nb d'animations
+_BUNDLE_ANIM  = struct.Struct("<HQQHH")        # len(nom), taille GIF, date GIF (ns), hauteur, nb images
+_BUNDLE_FRAME = struct.Struct("<HHIQ")         # largeur, hauteur, durée (ms), offset
+
+def gif_signature(gif_path):
+    st = os.stat(gif_path)
+    return st.st_size, st.st_mtime_ns
+
+def bake_bundle(path=BUNDLE_PATH):
+    index = []
+    for name, gif_path, target_height in ANIMATION_SOURCES:
+        index.append((name.encode(), gif_signature(gif_path), target_height,
+                      decode_gif(gif_path, target_height)))
+    offset = _BUNDLE_HEAD.size + sum(_BUNDLE_ANIM.size + len(raw) + len(frames) * _BUNDLE_FRAME.size
+                                     for raw, _, _, frames in index)
+    header = bytearray(_BUNDLE_HEAD.pack(BUNDLE_MAGIC, len(index)))
+    blobs = []
+    for raw, (length, mtime), target_height, frames in index:
+        header += _BUNDLE_ANIM.pack(len(raw), length, mtime, target_height, len(frames)) + raw
+        for (w, h), data, duration_ms in frames:
+            header += _BUNDLE_FRAME.pack(w, h, int(duration_ms), offset)
+            blobs.append(data)
+            offset += len(data)
+    with open(path + ".tmp", "wb") as f:
+        f.write(header)
+        for data in blobs:
+            f.write(data)
+    os.replace(path + ".tmp", path)
+    print(f"{path} : {len(index)} animations, {offset} octets")
+
+def open_bundle(path=BUNDLE_PATH):
+    try:
+        with open(path, "rb") as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # pas de mmap (build navigateur) : une seule lecture
+                buf = f.read()
+    except OSError:
+        return {}
+    view = memoryview(buf)
+    entries = {}
+    try:  # paquet vide, tronqué ou étranger : on repasse par les GIF
+        magic, count = _BUNDLE_HEAD.unpack_from(view, 0)
+        if magic != BUNDLE_MAGIC:
+            return {}
+        pos = _BUNDLE_HEAD.size
+        for _ in range(count):
+            name_len, length, mtime, target_height, n_frames = _BUNDLE_ANIM.unpack_from(view, pos)
+            pos += _BUNDLE_ANIM.size
+            name = bytes(view[pos:pos + name_len]).decode()
+            pos += name_len
+            frames = []
+            for _ in range(n_frames):
+                w, h, duration_ms, off = _BUNDLE_FRAME.unpack_from(view, pos)
+                if off + w * h * 4 > len(view):
+                    raise ValueError(f"image hors du paquet : {name}")
+                frames.append((w, h, duration_ms, off))
+                pos += _BUNDLE_FRAME.size
+            entries[name] = ((length, mtime), target_height, frames)
+    except (struct.error, ValueError, UnicodeDecodeError):
+        return {}
+    entries[None] = view  # garde le mapping vivant tant que les Surfaces l'utilisent
+    return entries
+
+def bundle_frames(bundle, name, gif_path, target_height):
+    entry = bundle.get(name)
+    if entry is None:
+        return None
+    signature, baked_height, frames = entry
+    try:
+        if baked_height != target_height or signature != gif_signature(gif_path):
+            return None
+    except OSError:
+        pass  # GIF absent à côté du paquet (build packagé) : on fait confiance au paquet
+    view = bundle[None]
+    surfaces = [pygame.image.frombuffer(view[off:off + w * h * 4], (w, h), "RGBA")
+                for w, h, _, off in frames]
+    return surfaces, [duration_ms / 1000 for _, _, duration_ms, _ in frames]
+
+if __name__ == "__main__" and cli_args.bake:
+    bake_bundle()
+    sys.exit()
+
+# ────────────────────────────────────────────────
+# ANIMATEUR PARTAGÉ
+# ────────────────────────────────────────────────
+# Un Clip est immuable : images des deux orientations et fins cumulées des
+# images en ms entiers. L'image courante se retrouve par bisect sur le temps
+# écoulé depuis le début du clip, compté en ticks de simulation (sim_tick),
+# donc sans accumulation flottante qui dérive. Un Animator ne retient que le
+# clip joué et son tick de départ ; changer de clip le reprend à zéro.
+class Clip:
+    __slots__ = ("name", "frames", "ends", "length", "loop")
+
+    def __init__(self, name, frames, durations, loop=True):
+        self.name = name
+        self.frames = frames
+        ends = []
+        t = 0
+        for d in durations:
+            t += max(1, round(d * 1000))
+            ends.append(t)
+        self.ends = tuple(ends)
+        self.length = t
+        self.loop = loop
+
+    def frame_index(self, ms):
+        if ms >= self.length:
+            if not self.loop:
+                return len(self.ends) - 1
+            ms %= self.length
+        return bisect.bisect_right(self.ends, ms)
+
+class Animator:
+    __slots__ = ("clip", "start")
+
+    def __init__(self, clip):
+        self.clip = clip
+        self.start = sim_tick
+
+    def play(self, clip, restart=False):
+        if restart or clip is not self.clip:
+            self.clip = clip
+            self.start = sim_tick
+
+    def elapsed_ms(self):
+        return (sim_tick - self.start) * 1000 // SIM_HZ
+
+    def frame(self, direction):
+        clip = self.clip
+        return clip.frames[direction][clip.frame_index(self.elapsed_ms())]
+
+# ────────────────────────────────────────────────
+# CACHE D'IMAGES ORIENTÉES
+# ────────────────────────────────────────────────
+# Les GIF regardent vers la gauche : la version retournée est calculée une
+# seule fois ici, les update() ne font plus que choisir une image existante.
+LEFT, RIGHT = -1, 1
+ONE_SHOT_CLIPS = {"shooter_attack"}  # jouées une fois, puis figées sur la dernière image
+
+class LazyClips(dict):
+    # Un clip pas encore chargé est terminé à la première demande
+    def __missing__(self, name):
+        return assets.animation(name)
+
+ANIMATIONS = LazyClips()
+
+def register_animation(name, frames, durations):
+    clip = Clip(name,
+                {LEFT: [ATLAS.add(f) for f in frames],
+                 RIGHT: [ATLAS.add(pygame.transform.flip(f, True, False)) for f in frames]},
+                durations, loop=name not in ONE_SHOT_CLIPS)
+    dict.__setitem__(ANIMATIONS, name, clip)
+    return clip
+
+def anim_frame(name, direction, index):
+    return ANIMATIONS[name].frames[direction][index]
 
 # ────────────────────────────────────────────────
-# GÉNÉRATION DES PLANS DE PARALLAXE
+# GESTIONNAIRE D'ASSETS (décodage parallèle, chargement paresseux)
 # ────────────────────────────────────────────────
-def make_far(w):
+# Décodage GIF/PNG et redimensionnement PIL (qui relâchent le GIL) tournent
+# sur un pool de threads ; les Surfaces ne sont créées que sur le thread
+# principal, quand on termine un asset. Les entrées du paquet pré-cuit ne
+# passent pas par le pool. Le jeu n'attend (écran de chargement) que les
+# assets de la première arène ; LAZY_ANIMATIONS sont décodées en tâche de
+# fond derrière eux et terminées à leur première utilisation.
+LAZY_ANIMATIONS = {"melee_2_walk", "melee_2_idle"}
+
+class AssetManager:
+    def __init__(self, bundle, workers=None):
+        self.bundle = bundle
+        self.sources = {name: (path, h) for name, path, h in ANIMATION_SOURCES}
+        self.pending = {}   # clé -> Future du décodage
+        self.images = {}
+        # Pas de threads dans le build navigateur : décodage immédiat
+        self.pool = (None if platform.system() == "Emscripten" else
+                     ThreadPoolExecutor(workers or min(8, (os.cpu_count() or 1) + 1),
+                                        thread_name_prefix="assets"))
+
+    def _submit(self, key, fn, *args):
+        if key in self.pending:
+            return
+        if self.pool is not None:
+            self.pending[key] = self.pool.submit(fn, *args)
+        else:
+            future = self.pending[key] = Future()
+            future.set_result(fn(*args))
+
+    def prefetch(self, name):
+        if name in ANIMATIONS:
+            return
+        path, h = self.sources[name]
+        baked = bundle_frames(self.bundle, name, path, h) if self.bundle else None
+        if baked:
+            register_animation(name, *baked)
+        else:
+            self._submit(name, decode_gif, path, h)
+
+    def prefetch_image(self, path, target_height):
+        if (path, target_height) not in self.images:
+            self._submit((path, target_height), decode_image, path, target_height)
+
+    def animation(self, name):
+        self.prefetch(name)
+        if name in self.pending:
+            register_animation(name, *gif_surfaces(self.pending.pop(name).result()))
+        return dict.__getitem__(ANIMATIONS, name)
+
+    def image(self, path, target_height):
+        key = (path, target_height)
+        if key not in self.images:
+            self.prefetch_image(path, target_height)
+            self.finish(key)
+        return self.images.pop(key)  # la tuile est ensuite gardée par _tile_cache
+
+    def finish(self, key):
+        if isinstance(key, tuple):
+            size, data = self.pending.pop(key).result()
+            self.images[key] = backend.prepare(pygame.image.fromstring(data, size, "RGBA"))
+        else:
+            self.animation(key)
+
+    def load(self, keys, progress=None):
+        # Termine `keys` au fil des décodages ; progress(fait, total, clé) entre deux
+        keys = [k for k in keys if k in self.pending]
+        total = len(keys)
+        if progress:
+            progress(0, total, None)
+        while keys:
+            done, _ = wait([self.pending[k] for k in keys], timeout=1 / 30,
+                           return_when=FIRST_COMPLETED)
+            for key in [k for k in keys if self.pending[k] in done]:
+                self.finish(key)
+                keys.remove(key)
+                if progress:
+                    progress(total - len(keys), total, key)
+            if progress and not done:
+                progress(total - len(keys), total, None)
+
+assets = AssetManager(open_bundle())
+for _name, _, _ in ANIMATION_SOURCES:
+    if _name not in LAZY_ANIMATIONS:
+        assets.prefetch(_name)
+for _name in LAZY_ANIMATIONS:
+    assets.prefetch(_name)
+
+# ────────────────────────────────────────────────
+# GÉNÉRATION DES PLANS DE PARALLAXE (tuiles)
+# ────────────────────────────────────────────────
+# Chaque plan ne garde qu'une tuile répétable ; seul ce qui est visible pour
+# cam_x est blitté. La mémoire ne dépend plus de WORLD_WIDTH.
+def make_far(w=WIDTH):
     surf = pygame.Surface((w, HEIGHT))
     surf.fill(SKY_FAR)
+    # Bandes horizontales pour que la tuile se raccorde avec elle-même
     for y in range(-40, HEIGHT, 120):
-        pygame.draw.polygon(surf, (255, 255, 255, 60),
-                            [(0, y), (w, y + 40), (w, y + 60), (0, y + 20)])
+        pygame.draw.rect(surf, (255, 255, 255, 60), (0, y + 20, w, 20))
     return surf
 
-def make_mid(w):
-    building_img = pygame.image.load("layers/building_layer.png").convert_alpha()
-    orig_width, orig_height = building_img.get_size()
-    target_height = HEIGHT - 60  # Ajusté pour éviter chevauchement
-    scale_factor = target_height / orig_height
-    new_width = int(orig_width * scale_factor)
-    scaled_img = pygame.transform.scale(building_img, (new_width, target_height))
+def make_near(w=360):  # Espacement augmenté (1.5x)
     surf = pygame.Surface((w, HEIGHT), pygame.SRCALPHA)
-    num_repeats = math.ceil(w / new_width) + 1
-    for i in range(num_repeats):
-        surf.blit(scaled_img, (i * new_width, 0))
+    pygame.draw.rect(surf, (91, 50, 14), (141, HEIGHT - 300, 18, 180))  # Tronc 1.5x
+    pygame.draw.circle(surf, TREE_NEAR, (150, HEIGHT - 300), 102)  # Feuillage 1.5x
     return surf
 
-def make_near(w):
-    surf = pygame.Surface((w, HEIGHT), pygame.SRCALPHA)
-    for x in range(0, w, 360):  # Espacement augmenté (1.5x)
-        pygame.draw.rect(surf, (91, 50, 14), (x + 141, HEIGHT - 300, 18, 180))  # Tronc 1.5x
-        pygame.draw.circle(surf, TREE_NEAR, (x + 150, HEIGHT - 300), 102)  # Feuillage 1.5x
-    return surf
+def load_layer_image(path, target_height):
+    return assets.image(path, target_height)
+
+# "source" : nom d'un générateur de LAYER_GENERATORS, ou chemin d'image (+ "height")
+LAYER_GENERATORS = {"far": make_far, "near": make_near}
+PARALLAX_LAYERS = [
+    {"factor": 0.25, "source": "far"},
+    {"factor": 0.5,  "source": "layers/building_layer.png", "height": HEIGHT - 60},  # Ajusté pour éviter chevauchement
+    {"factor": 0.8,  "source": "near"},
+]
+for _spec in PARALLAX_LAYERS:
+    if _spec["source"] not in LAYER_GENERATORS:
+        assets.prefetch_image(_spec["source"], _spec.get("height", HEIGHT))
+
+# Tuiles partagées entre plans et tronçons de niveau, libérées au dernier release
+_tile_cache = {}
+
+def acquire_tile(spec):
+    key = (spec["source"], spec.get("height", HEIGHT))
+    entry = _tile_cache.get(key)
+    if entry is None:
+        source = spec["source"]
+        if source in LAYER_GENERATORS:
+            tile = backend.prepare(LAYER_GENERATORS[source]())
+        else:
+            tile = load_layer_image(source, key[1])
+        entry = _tile_cache[key] = [tile, 0]
+    entry[1] += 1
+    return entry[0]
+
+def release_tile(spec):
+    key = (spec["source"], spec.get("height", HEIGHT))
+    entry = _tile_cache[key]
+    entry[1] -= 1
+    if entry[1] == 0:
+        del _tile_cache[key]
+
+class ParallaxLayer:
+    def __init__(self, tile, factor, y=0):
+        self.tile = tile
+        self.factor = factor
+        self.y = y
+        self.tile_w = tile.get_width()
 
-far_layer  = make_far(WORLD_WIDTH)
-mid_layer  = make_mid(WORLD_WIDTH)
-near_layer = make_near(WORLD_WIDTH)
+    def draw(self, out, cx):
+        x = -(int(cx * self.factor) % self.tile_w)
+        while x < WIDTH:
+            out.blit(self.tile, (x, self.y))
+            x += self.tile_w
 
-def draw_parallax(cx):
-    screen.blit(far_layer, (-cx * 0.25, 0))
-    screen.blit(mid_layer, (-cx * 0.5, 0))
-    screen.blit(near_layer, (-cx * 0.8, 0))
+def build_parallax(specs):
+    return [ParallaxLayer(acquire_tile(spec), spec["factor"], spec.get("y", 0))
+            for spec in specs]
+
+def release_parallax(specs):
+    for spec in specs:
+        release_tile(spec)
+
+def draw_parallax(out, cx):  # fond compris : les plans lointains dépendent du palier de qualité
+    for layer in quality.backdrop(out, cx, world.layers_at(cx + WIDTH // 2)):
+        layer.draw(out, cx)
 
 # ────────────────────────────────────────────────
 # ARÈNES & VAGUES
@@ -149,30 +748,782 @@ ARENAS = [
 ]
 
 # ────────────────────────────────────────────────
-# OUTIL : détection de sol sous un rect
+# INDEX DE LA GÉOMÉTRIE DU NIVEAU
+# ────────────────────────────────────────────────
+# Plateformes rangées par tranches de `bucket_w` pixels en x : une requête ne
+# regarde que les tranches couvertes par la sonde, quel que soit le nombre
+# de corniches. Les plateformes « one_way » ne bloquent que par le dessus,
+# pour qui tombe et avait le bas au-dessus d'elles au pas précédent.
+class LevelGeometry:
+    def __init__(self, bucket_w=256):
+        self.bucket_w = bucket_w
+        self.buckets = {}
+        self.platforms = {}  # id -> (rect, one_way)
+        self._next_id = 0
+        self.version = 0     # change à chaque ajout/retrait (graphe de navigation)
+
+    def add(self, rect, one_way=False):
+        pid = self._next_id
+        self._next_id += 1
+        self.platforms[pid] = (rect, one_way)
+        self.version += 1
+        for bx in range(rect.left // self.bucket_w, (rect.right - 1) // self.bucket_w + 1):
+            self.buckets.setdefault(bx, []).append(pid)
+        return pid
+
+    def near(self, x0, x1):
+        # Plateformes des tranches couvrant [x0, x1), dans l'ordre d'ajout
+        bw = self.bucket_w
+        b0, b1 = int(x0) // bw, (int(x1) - 1) // bw
+        if b0 == b1:
+            ids = self.buckets.get(b0, ())
+        else:
+            found = set()
+            for bx in range(b0, b1 + 1):
+                found.update(self.buckets.get(bx, ()))
+            ids = sorted(found)
+        return [self.platforms[pid] for pid in ids]
+
+    def remove(self, pid):
+        rect, _ = self.platforms.pop(pid)
+        self.version += 1
+        for bx in range(rect.left // self.bucket_w, (rect.right - 1) // self.bucket_w + 1):
+            bucket = self.buckets[bx]
+            bucket.remove(pid)
+            if not bucket:
+                del self.buckets[bx]
+
+    def ground_below(self, rect, dx=0):
+        probe = rect.move(dx, 2)
+        for p, _ in self.near(probe.left, probe.right):
+            if probe.colliderect(p) and probe.bottom <= p.top + 4:
+                return True
+        return False
+
+# ────────────────────────────────────────────────
+# GRAPHE DE NAVIGATION (marche, chutes, sauts)
+# ────────────────────────────────────────────────
+# Les plateformes chargées sont fusionnées en surfaces (même dessus, bords
+# jointifs). Arêtes : marche vers une marche voisine d'au plus MEL_DROP_H,
+# chute depuis un bord sur la première surface en dessous, saut quand l'arc
+# de PLAYER_JUMP / GRAVITY l'atteint à la vitesse de l'ennemi le plus lent
+# (relue à chaque build() : l'équilibrage surcharge SHO_/MEL_).
+# Le graphe est refait quand la géométrie change (tronçon chargé ou
+# déchargé). route() est un Dijkstra à rebours depuis la surface du joueur,
+# gardé en cache : il n'est relancé que quand le joueur change de surface.
+# Pour un ennemi au sol, steer() n'est plus qu'une lecture de tables.
+NAV_TAKEOFF   = 12    # px d'appel avant un bord (> vitesse max d'un ennemi)
+NAV_JUMP_COST = 120   # pénalités en px de marche équivalents
+NAV_DROP_COST = 40
+NAV_FAR       = 1e9   # borne ouverte d'une zone d'appel
+NAV_WALK, NAV_DROP, NAV_JUMP = 0, 1, 2
+
+def jump_ticks(rise):
+    # Ticks de vol d'un saut jusqu'à retomber à `rise` px au-dessus du point
+    # d'appel (négatif : plus bas), None si l'apex ne passe pas au-dessus
+    h, v, ticks, apex = 0.0, -PLAYER_JUMP, 0, 0.0
+    while True:
+        v += GRAVITY
+        h -= v
+        ticks += 1
+        apex = max(apex, h)
+        if v > 0 and h <= rise:
+            return ticks if apex > rise else None
+
+class NavGraph:
+    def __init__(self, geometry):
+        self.geometry = geometry
+        self.version = None
+        self.surfaces = []   # (left, right, top, solid), triées par (top, left)
+        self.by_top = {}     # top -> [(left, right, id)]
+        self.edges = []      # id -> [(dest, kind, lo, hi, side, cost)]
+        self.routes = {}
+        self.tables = {}
+        self.target = None
+        self.speed = 0       # px/tick du plus lent : portée de saut sûre pour tous
+
+    def sync(self):
+        if self.version != self.geometry.version:
+            self.build()
+
+    def build(self):
+        self.version = self.geometry.version
+        self.speed = min(SHO_SPEED_RANGE[0], MEL_SPEED_RANGE[0])
+        surfaces = []
+        for top, left, right, one_way in sorted((r.top, r.left, r.right, one_way)
+                                                for r, one_way in self.geometry.platforms.values()):
+            if surfaces and surfaces[-1][2] == top and left <= surfaces[-1][1]:
+                l, r, _, solid = surfaces[-1]
+                surfaces[-1] = (l, max(r, right), top, solid and not one_way)
+            else:
+                surfaces.append((left, right, top, not one_way))
+        self.surfaces = surfaces
+        self.by_top = {}
+        for sid, (left, right, top, _) in enumerate(surfaces):
+            self.by_top.setdefault(top, []).append((left, right, sid))
+        self.edges = [self._edges_from(a) for a in range(len(surfaces))]
+        self.incoming = [[] for _ in surfaces]
+        for a, edges in enumerate(self.edges):
+            for edge in edges:
+                self.incoming[edge[0]].append((a, edge))
+        self.routes.clear()
+        self.tables.clear()
+        self.target = None
+        if USE_NUMPY:
+            self.left, self.right, self.top = (np.array([s[k] for s in surfaces], dtype=float)
+                                               for k in range(3))
+
+    def _edges_from(self, a):
+        al, ar, at, _ = self.surfaces[a]
+        edges = []
+
+        def add(b, kind, lo, hi, side):
+            bl, br, _, _ = self.surfaces[b]
+            cost = abs((bl + br) - (al + ar)) / 2 + (NAV_JUMP_COST if kind == NAV_JUMP else
+                                                     NAV_DROP_COST if kind == NAV_DROP else 0)
+            edges.append((b, kind, lo, hi, side, cost))
+
+        # Chute : première surface sous chaque bord, juste au-delà
+        for side, px, lo, hi in ((-1, al - 1, -NAV_FAR, al + NAV_TAKEOFF),
+                                 (1, ar, ar - NAV_TAKEOFF, NAV_FAR)):
+            below = [(bt, b) for b, (bl, br, bt, _) in enumerate(self.surfaces)
+                     if bt > at and bl <= px < br]
+            if below:
+                bt, b = min(below)
+                add(b, NAV_WALK if bt - at <= MEL_DROP_H else NAV_DROP, lo, hi, side)
+        for b, (bl, br, bt, solid) in enumerate(self.surfaces):
+            rise = at - bt
+            if b == a:
+                continue
+            if bl < ar and al < br:
+                # Au-dessus : appel au milieu de la partie commune, pour ne pas
+                # la quitter pendant le vol
+                lo, hi = max(al, bl), min(ar, br)
+                if rise > 0 and hi - lo >= NAV_TAKEOFF and jump_ticks(rise):
+                    mid = (lo + hi) // 2
+                    add(b, NAV_JUMP, mid - NAV_TAKEOFF // 2, mid + NAV_TAKEOFF // 2,
+                        1 if bl + br >= lo + hi else -1)
+                continue
+            side = 1 if bl >= ar else -1
+            lo, hi = (ar - NAV_TAKEOFF, NAV_FAR) if side > 0 else (-NAV_FAR, al + NAV_TAKEOFF)
+            gap = bl - ar if side > 0 else al - br
+            if gap == 0 and 0 < rise <= MEL_DROP_H and solid:
+                add(b, NAV_WALK, lo, hi, side)  # marche pleine : on monte en la traversant
+                continue
+            ticks = jump_ticks(rise)
+            if ticks and gap <= ticks * self.speed:
+                add(b, NAV_JUMP, lo, hi, side)
+        return edges
+
+    def surface_at(self, rect):
+        for left, right, sid in self.by_top.get(rect.bottom, ()):
+            if left < rect.right and rect.left < right:
+                return sid
+        return None
+
+    def track(self, player):
+        self.sync()
+        if player.on_ground:
+            sid = self.surface_at(player.rect)
+            if sid is not None:
+                self.target = sid
+
+    def route(self, target):
+        # Arête de sortie de chaque surface sur le plus court chemin vers `target`
+        best = self.routes.get(target)
+        if best is None:
+            dist = [math.inf] * len(self.surfaces)
+            best = [None] * len(self.surfaces)
+            dist[target] = 0
+            heap = [(0, target)]
+            while heap:
+                d, b = heapq.heappop(heap)
+                if d > dist[b]:
+                    continue
+                for a, edge in self.incoming[b]:
+                    nd = d + edge[5]
+                    if nd < dist[a]:
+                        dist[a] = nd
+                        best[a] = edge
+                        heapq.heappush(heap, (nd, a))
+            self.routes[target] = best
+        return best
+
+    def steer(self, sid, cx):
+        # (direction, saut) vers la surface du joueur ; None : déjà dessus,
+        # en l'air ou pas de chemin, l'ennemi le poursuit alors à vue
+        if sid is None or self.target is None:
+            return None
+        edge = self.route(self.target)[sid]
+        if edge is None:
+            return None
+        _, kind, lo, hi, side, _ = edge
+        if cx < lo:
+            return 1, False
+        if cx > hi:
+            return -1, False
+        return side, kind == NAV_JUMP
+
+    def past_edge(self, sid, rect, direction):
+        left, right, _, _ = self.surfaces[sid]
+        return rect.left + direction * 6 >= right or rect.right + direction * 6 <= left
+
+    # Versions sur tableaux (moteur NumPy) : mêmes règles, une passe par tick
+    def surfaces_of(self, x, bottom, w, on_ground):
+        sid = np.full(len(x), -1)
+        if not self.surfaces or not len(x):
+            return sid
+        match = (on_ground[:, None] & (bottom[:, None] == self.top) &
+                 (x[:, None] < self.right) & (x[:, None] + w[:, None] > self.left))
+        found = match.any(axis=1)
+        sid[found] = match.argmax(axis=1)[found]
+        return sid
+
+    def steer_arrays(self, sid, cx):
+        table = self.tables.get(self.target)
+        if table is None:
+            # Une case de plus, en fin : l'indice -1 (en l'air) n'a pas de route
+            n = len(self.surfaces) + 1
+            table = has, lo, hi, side, jump = (np.zeros(n, dtype=bool), np.zeros(n), np.zeros(n),
+                                               np.zeros(n), np.zeros(n, dtype=bool))
+            if self.target is not None:
+                for a, edge in enumerate(self.route(self.target)):
+                    if edge is not None:
+                        has[a] = True
+                        _, kind, lo[a], hi[a], side[a], _ = edge
+                        jump[a] = kind == NAV_JUMP
+            self.tables[self.target] = table
+        has, lo, hi, side, jump = table
+        ok, lo, hi = has[sid], lo[sid], hi[sid]
+        inside = (cx >= lo) & (cx <= hi)
+        return ok, np.where(cx < lo, 1.0, np.where(cx > hi, -1.0, side[sid])), ok & inside & jump[sid]
+
+# ────────────────────────────────────────────────
+# NIVEAU DÉCOUPÉ EN TRONÇONS, CHARGÉ À LA DEMANDE
+# ────────────────────────────────────────────────
+# Un niveau est un dossier : level.json (largeur, largeur de tronçon, plans
+# de parallaxe, nombre d'arènes, liste des fichiers de tronçon) et un JSON
+# par tronçon (plateformes [x, y, w, h, one_way], arènes avec leur index et
+# leurs vagues, plans de parallaxe propres au tronçon). Seuls les tronçons
+# proches de cam_x sont chargés ; mémoire et temps de chargement suivent
+# l'écran, pas la longueur du niveau. Sans --level, le monde d'origine est
+# découpé en mémoire de la même façon.
+LEVEL_FORMAT  = 1
+GROUND_TOP    = HEIGHT - 40
+CHUNK_WIDTH   = 1600
+STREAM_MARGIN = WIDTH      # tronçons chargés jusqu'à un écran de la caméra
+EVICT_MARGIN  = 2 * WIDTH  # et déchargés au-delà de deux (hystérésis)
+
+def split_level(width, platforms, arenas, chunk_width=CHUNK_WIDTH):
+    # platforms : [(Rect, one_way)] ; une plateforme à cheval est coupée
+    chunks = []
+    for x0 in range(0, width, chunk_width):
+        x1 = min(x0 + chunk_width, width)
+        chunk = {"x": x0, "platforms": [], "arenas": []}
+        for rect, one_way in platforms:
+            part = rect.clip(pygame.Rect(x0, rect.top, x1 - x0, rect.h))
+            if part.w:
+                chunk["platforms"].append([part.x, part.y, part.w, part.h, int(one_way)])
+        for index, arena in enumerate(arenas):
+            if x0 <= arena["x"] < x1:
+                chunk["arenas"].append(dict(arena, index=index))
+        chunks.append(chunk)
+    manifest = {"format": LEVEL_FORMAT, "width": width, "chunk_width": chunk_width,
+                "parallax": PARALLAX_LAYERS, "arena_count": len(arenas),
+                "chunks": [f"chunk_{i:03d}.json" for i in range(len(chunks))]}
+    return manifest, chunks
+
+def default_level():
+    return split_level(WORLD_WIDTH, [(pygame.Rect(0, GROUND_TOP, WORLD_WIDTH, 40), False)], ARENAS)
+
+def write_level(path, manifest, chunks):
+    os.makedirs(path, exist_ok=True)
+    for name, chunk in zip(manifest["chunks"], chunks):
+        with open(os.path.join(path, name), "w", encoding="utf-8") as f:
+            json.dump(chunk, f)
+    with open(os.path.join(path, "level.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+def open_level_dir(path):
+    with open(os.path.join(path, "level.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != LEVEL_FORMAT:
+        raise ValueError(f"{path} : format de niveau {manifest.get('format')} non géré")
+
+    def read_chunk(i):
+        with open(os.path.join(path, manifest["chunks"][i]), encoding="utf-8") as f:
+            return json.load(f)
+    return manifest, read_chunk
+
+def level_signature(path):
+    # Empreinte du contenu (manifeste + tronçons) : un rejeu reconnaît son niveau
+    # quel que soit le chemin donné ; lue seulement pour --record et les rejeux
+    if path is None:
+        return None
+    with open(os.path.join(path, "level.json"), "rb") as f:
+        data = f.read()
+    crc = zlib.crc32(data)
+    for name in json.loads(data)["chunks"]:
+        with open(os.path.join(path, name), "rb") as f:
+            crc = zlib.crc32(f.read(), crc)
+    return f"{crc:08x}"
+
+class LevelStream:
+    def __init__(self, manifest, read_chunk):
+        self.read_chunk = read_chunk
+        self.width = manifest["width"]
+        self.chunk_w = manifest["chunk_width"]
+        self.chunk_count = len(manifest["chunks"])
+        self.arena_count = manifest["arena_count"]
+        self.base_specs = manifest["parallax"]
+        self.base_layers = build_parallax(self.base_specs)
+        self.geometry = LevelGeometry()
+        self.loaded = {}   # n° de tronçon -> (ids plateformes, index arènes, specs, plans)
+        self.arenas = {}
+
+    def chunk_span(self, x0, x1):
+        first = max(0, int(x0) // self.chunk_w)
+        last = min(self.chunk_count - 1, int(x1) // self.chunk_w)
+        return range(first, last + 1)
+
+    def update(self, cx):
+        wanted = self.chunk_span(cx - STREAM_MARGIN, cx + WIDTH + STREAM_MARGIN)
+        for i in wanted:
+            if i not in self.loaded:
+                self._load(i)
+        keep = self.chunk_span(cx - EVICT_MARGIN, cx + WIDTH + EVICT_MARGIN)
+        for i in [i for i in self.loaded if i not in keep]:
+            self._evict(i)
+
+    def _load(self, i):
+        chunk = self.read_chunk(i)
+        pids = [self.geometry.add(pygame.Rect(x, y, w, h), bool(one_way))
+                for x, y, w, h, one_way in chunk["platforms"]]
+        for arena in chunk["arenas"]:
+            self.arenas[arena["index"]] = arena
+        specs = chunk.get("parallax")
+        layers = build_parallax(specs) if specs else None
+        self.loaded[i] = (pids, [a["index"] for a in chunk["arenas"]], specs, layers)
+
+    def _evict(self, i):
+        pids, arena_ids, specs, _ = self.loaded.pop(i)
+        for pid in pids:
+            self.geometry.remove(pid)
+        for index in arena_ids:
+            del self.arenas[index]
+        if specs:
+            release_parallax(specs)
+
+    def arena(self, index):
+        return self.arenas.get(index)
+
+    def layers_at(self, x):
+        entry = self.loaded.get(int(x) // self.chunk_w)
+        return entry[3] if entry and entry[3] else self.base_layers
+
+def open_world(path=None):
+    global WORLD_WIDTH
+    manifest, chunks = open_level_dir(path) if path else default_level()
+    read_chunk = chunks if callable(chunks) else chunks.__getitem__
+    stream = LevelStream(manifest, read_chunk)
+    WORLD_WIDTH = stream.width
+    return stream
+
+def draw_loading(done, total, key):
+    for event in pygame.event.get(pygame.QUIT):
+        pygame.quit(); sys.exit()
+    screen.fill(C_BG)
+    label = font.render("Chargement…", True, (255, 255, 255))
+    screen.blit(label, label.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 40)))
+    pygame.draw.rect(screen, C_BAR_BG, (WIDTH // 4, HEIGHT // 2, WIDTH // 2, 16))
+    pygame.draw.rect(screen, C_BAR, (WIDTH // 4, HEIGHT // 2, WIDTH // 2 * done // max(1, total), 16))
+    backend.present_surface(screen)
+
+# Écran de chargement : seulement les assets de la première arène
+assets.load([name for name, _, _ in ANIMATION_SOURCES if name not in LAZY_ANIMATIONS] +
+            [(spec["source"], spec.get("height", HEIGHT)) for spec in PARALLAX_LAYERS
+             if spec["source"] not in LAYER_GENERATORS],
+            None if HEADLESS else draw_loading)
+
+world = open_world(cli_args.level)
+level = world.geometry
+nav = NavGraph(level)
+
+# ────────────────────────────────────────────────
+# REGISTRE D'ENTITÉS
+# ────────────────────────────────────────────────
+# Chaque entité reçoit un identifiant stable. destroy() ne fait que la marquer
+# (idempotent : plus de double remove) ; flush() en fin de tick la retire par
+# échange avec la dernière, en O(1). Une vue dense par classe (tireurs,
+# mêlées, véhicules, balles) est tenue à jour de la même façon.
+class EntityStore:
+    # `columns` : stockage parallèle optionnel (ex. EnemyBatch) gardé aligné
+    # sur `items` via append / swap_remove / clear. `recycle` reçoit chaque
+    # entité retirée (retour au pool).
+    def __init__(self, columns=None, recycle=None):
+        self.columns = columns
+        self.recycle = recycle
+        self.items = []
+        self._slot = {}
+        self._views = {}
+        self._view_slot = {}
+        self._doomed = []
+        self._next_handle = 1
+
+    def add(self, ent, handle=None):
+        if handle is None:
+            handle = self._next_handle
+            self._next_handle += 1
+        ent.handle = handle
+        ent.alive = True
+        self._slot[handle] = len(self.items)
+        self.items.append(ent)
+        if self.columns is not None:
+            self.columns.append(ent)
+        view = self._views.setdefault(type(ent), [])
+        self._view_slot[handle] = len(view)
+        view.append(ent)
+        return handle
+
+    def get(self, handle):
+        idx = self._slot.get(handle)
+        return None if idx is None else self.items[idx]
+
+    def index_of(self, ent):
+        return self._slot[ent.handle]
+
+    def destroy(self, ent):
+        if ent.alive:
+            ent.alive = False
+            self._doomed.append(ent)
+
+    def flush(self):
+        for ent in self._doomed:
+            if self.columns is not None:
+                self.columns.swap_remove(self._slot[ent.handle])
+            self._swap_remove(self.items, self._slot, ent)
+            self._swap_remove(self._views[type(ent)], self._view_slot, ent)
+            if self.recycle is not None:
+                self.recycle(ent)
+        self._doomed.clear()
+
+    @staticmethod
+    def _swap_remove(items, slots, ent):
+        idx = slots.pop(ent.handle)
+        last = items.pop()
+        if last is not ent:
+            items[idx] = last
+            slots[last.handle] = idx
+
+    def clear(self):
+        for ent in self.items:
+            ent.alive = False
+            if self.recycle is not None:
+                self.recycle(ent)
+        if self.columns is not None:
+            self.columns.clear()
+        self.items.clear()
+        self._slot.clear()
+        self._views.clear()
+        self._view_slot.clear()
+        self._doomed.clear()
+
+    def reset(self):  # nouvelle partie : identifiants repris à 1 (l'ordonnanceur d'IA en dépend)
+        self.clear()
+        self._next_handle = 1
+
+    def load(self, ents, next_handle):  # retour arrière : mêmes identifiants, même ordre
+        self.clear()
+        for ent in ents:
+            self.add(ent, ent.handle)
+        self._next_handle = next_handle
+
+    def view(self, cls):
+        return self._views.get(cls, ())
+
+    def __iter__(self):
+        # Les entités ajoutées pendant le parcours attendent le tick suivant
+        items = self.items
+        for i in range(len(items)):
+            ent = items[i]
+            if ent.alive:
+                yield ent
+
+    def __len__(self):
+        return len(self.items) - len(self._doomed)
+
+
+def _by_handle(ent):  # ordre déterministe, indépendant des échanges de flush()
+    return ent.handle
+
+# ────────────────────────────────────────────────
+# BROADPHASE DES COLLISIONS (balayage sur x)
+# ────────────────────────────────────────────────
+# Le monde défile à l'horizontale : on trie les ennemis par bord gauche une
+# fois par tick, puis chaque requête ne garde par bisect que ceux qui peuvent
+# chevaucher en x. colliderect ne tourne que sur ces candidats, rendus dans
+# l'ordre de la liste d'origine.
+class SweepAndPrune:
+    def __init__(self):
+        self.lefts = []
+        self.entries = []
+        self.max_w = 0
+
+    def rebuild(self, items):
+        lefts = [e.rect.left for e in items]
+        order = sorted(range(len(items)), key=lefts.__getitem__)
+        self.lefts = [lefts[i] for i in order]
+        self.entries = [(i, items[i]) for i in order]
+        self.max_w = max([e.rect.w for e in items], default=0)
+
+    def query(self, rect):
+        lo = bisect.bisect_right(self.lefts, rect.left - self.max_w)
+        hi = bisect.bisect_left(self.lefts, rect.right)
+        hits = self.entries[lo:hi]
+        if len(hits) > 1:
+            hits.sort()
+        return [item for _, item in hits]
+
+enemy_broadphase = SweepAndPrune()
+
+# ────────────────────────────────────────────────
+# PROFILEUR PAR PHASE
+# ────────────────────────────────────────────────
+# Chaque phase de main() (événements, phases de simulate(), décor, entités,
+# HUD, flip) passe par timed() : sans profileur c'est un simple appel. Actif
+# (--profile ou F3), il garde les dernières frames (durées par phase,
+# compteurs d'entités, de blits et de Surfaces créées) pour l'overlay et
+# l'export JSON / trace Chrome (chrome://tracing, Perfetto).
+class FrameProfiler:
+    def __init__(self, history=600, shown=240):
+        self.enabled = False
+        self.overlay = False
+        self.frames = deque(maxlen=history)
+        self.shown = shown
+        self.blits = 0
+        self.surfaces = 0
+        self._events = []
+        self._start = 0.0
+        self.origin = time.perf_counter()
+        self.panel = None
+
+    def begin_frame(self):
+        self._events = []
+        self.blits = 0
+        self.surfaces = 0
+        self._start = time.perf_counter()
+
+    def add(self, name, t0, t1):
+        self._events.append((name, t0, t1))
+
+    def end_frame(self):
+        end = time.perf_counter()
+        phases = {}
+        for name, t0, t1 in self._events:
+            phases[name] = phases.get(name, 0.0) + 1000 * (t1 - t0)
+        self.frames.append({
+            "start": self._start, "ms": 1000 * (end - self._start), "phases": phases,
+            "events": self._events, "enemies": len(enemies), "bullets": len(bullets),
+            "blits": self.blits, "surfaces": self.surfaces})
+
+    def totals(self):
+        totals = {}
+        for frame in self.frames:
+            for name, ms in frame["phases"].items():
+                totals[name] = totals.get(name, 0.0) + ms
+        return totals
+
+    def export_json(self, path):
+        frames = [{k: v for k, v in f.items() if k not in ("start", "events")}
+                  for f in self.frames]
+        with open(path, "w") as f:
+            json.dump({"frames": frames}, f)
+
+    def export_trace(self, path):
+        us = lambda t: round((t - self.origin) * 1e6, 1)
+        events = []
+        for frame in self.frames:
+            start = frame["start"]
+            events.append({"name": "frame", "ph": "X", "pid": 0, "tid": 0,
+                           "ts": us(start), "dur": round(frame["ms"] * 1000, 1)})
+            for name, t0, t1 in frame["events"]:
+                events.append({"name": name, "ph": "X", "pid": 0, "tid": 0,
+                               "ts": us(t0), "dur": round((t1 - t0) * 1e6, 1)})
+            events.append({"name": "compteurs", "ph": "C", "pid": 0, "ts": us(start),
+                           "args": {k: frame[k] for k in ("enemies", "bullets", "blits", "surfaces")}})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def draw_overlay(self, out):
+        frames = list(self.frames)[-self.shown:]
+        if not frames:
+            return
+        # Panneau gardé d'une frame à l'autre (le compteur de surfaces l'ignore) ;
+        # le backend rafraîchit sa copie une fois redessiné
+        size = self.overlay_rect().size
+        if self.panel is None or self.panel.get_size() != size:
+            self.panel = pygame.Surface(size, pygame.SRCALPHA)
+        panel = self.panel
+        panel.fill((0, 0, 0, 170))
+        # Histogramme glissant : 2 px par ms, ligne du budget d'un pas
+        base = 80
+        for i, f in enumerate(frames):
+            h = min(int(f["ms"] * 2), base - 4)
+            color = (90, 220, 90) if f["ms"] <= 1000 * SIM_DT else (230, 80, 60)
+            pygame.draw.line(panel, color, (10 + i, base), (10 + i, base - h))
+        budget = base - int(2000 * SIM_DT)
+        pygame.draw.line(panel, (255, 255, 255), (10, budget), (10 + self.shown, budget))
+        # Barres par phase : moyenne sur la fenêtre affichée
+        totals = {}
+        for f in frames:
+            for name, ms in f["phases"].items():
+                totals[name] = totals.get(name, 0.0) + ms
+        y = base + 6
+        for name, total in totals.items():
+            ms = total / len(frames)
+            pygame.draw.rect(panel, (90, 160, 230), (120, y + 2, min(int(ms * 20), self.shown - 110), 8))
+            panel.blit(overlay_font.render(f"{name} {ms:.2f}", True, (255, 255, 255)), (10, y))
+            y += 13
+        last = frames[-1]
+        avg = sum(f["ms"] for f in frames) / len(frames)
+        lines = (f"frame {last['ms']:.1f} ms (moy {avg:.1f}, max {max(f['ms'] for f in frames):.1f})",
+                 f"ennemis {last['enemies']}  balles {last['bullets']}",
+                 f"blits {last['blits']}  surfaces {last['surfaces']}",
+                 quality.label())
+        for line in lines:
+            panel.blit(overlay_font.render(line, True, (255, 255, 255)), (10, y))
+            y += 13
+        backend.refresh(panel)
+        out.blit(panel, self.overlay_rect().topleft)
+
+    def overlay_rect(self):
+        w, h = self.shown + 20, 304
+        return pygame.Rect(WIDTH - w - 10, HEIGHT - h - 10, w, h)
+
+PROFILER = FrameProfiler()
+PROFILER.enabled = cli_args.profile
+overlay_font = pygame.font.SysFont(None, 18)
+
+def timed(profiler, name, fn, *args):
+    if profiler is None:
+        return fn(*args)
+    t0 = time.perf_counter()
+    result = fn(*args)
+    profiler.add(name, t0, time.perf_counter())
+    return result
+
+# ────────────────────────────────────────────────
+# HORLOGE DE SIMULATION, HASARD & INTERPOLATION
 # ────────────────────────────────────────────────
-def platform_below(rect, plats, dx=0):
-    probe = rect.move(dx, 2)
-    return any(probe.colliderect(p) and probe.bottom <= p.top + 4 for p in plats)
+# Temps simulé en ms : remplace pygame.time.get_ticks() pour les délais de
+# tir et de saut, qui suivent ainsi le pas fixe comme les animations.
+sim_time = 0
+sim_tick = 0  # pas écoulés, entier : horloge des Animator
+# Tout le hasard du jeu passe par ce générateur, réensemencé par reset_game() :
+# même graine + mêmes entrées = même partie.
+rng = random.Random()
+game_seed = 0
+
+def lerp_pos(ent, alpha):
+    px, py = ent.prev_pos
+    return (px + (ent.rect.x - px) * alpha,
+            py + (ent.rect.y - py) * alpha)
 
 # ────────────────────────────────────────────────
-# PLATEFORME SOL
+# CACHE DU RENDU D'INTERFACE
 # ────────────────────────────────────────────────
-platforms = [pygame.Rect(0, HEIGHT - 40, WORLD_WIDTH, 40)]
+# Chiffres pré-rendus (ombre incrustée) pour les pourcentages, barres de vie
+# indexées par (largeur, remplissage, palier d'échelle), textes du HUD
+# re-rendus seulement quand leur valeur change : plus aucun font.render ni
+# transform.scale par frame pour un écran plein d'ennemis touchés.
+class GlyphAtlas:
+    def __init__(self, font, chars="0123456789"):
+        self.glyphs = {}
+        for ch in chars:
+            text = font.render(ch, True, (255, 255, 255))
+            shadow = font.render(ch, True, (0, 0, 0))
+            glyph = pygame.Surface((text.get_width() + 1, text.get_height() + 1), pygame.SRCALPHA)
+            glyph.blit(shadow, (1, 1))
+            glyph.blit(text, (0, 0))
+            self.glyphs[ch] = ATLAS.add(glyph)
+        self.height = font.get_height()
+        self._runs = {}
+
+    def draw(self, out, value, center):
+        run = self._runs.get(value)
+        if run is None:
+            glyphs = [self.glyphs[ch] for ch in str(value)]
+            run = self._runs[value] = (glyphs, sum(g.get_width() - 1 for g in glyphs))
+        glyphs, width = run
+        x = center[0] - width / 2
+        y = center[1] - self.height / 2
+        for g in glyphs:
+            out.blit(g, (x, y))
+            x += g.get_width() - 1
+
+HIT_SCALE_STEPS = 20  # paliers d'échelle de la barre (1.0 → 2.0)
+_bar_cache = {}
+
+def hit_bar(width, fill, scale):
+    step = round((scale - 1.0) * HIT_SCALE_STEPS)
+    key = (width, fill, step)
+    bar = _bar_cache.get(key)
+    if bar is None:
+        bar = pygame.Surface((width, 12), pygame.SRCALPHA)
+        pygame.draw.rect(bar, C_BAR_BG, (0, 0, width, 12))
+        pygame.draw.rect(bar, C_BAR, (0, 0, fill, 12))
+        scale = 1.0 + step / HIT_SCALE_STEPS
+        if step:
+            bar = pygame.transform.scale(bar, (width * scale, 12 * scale))
+        bar = _bar_cache[key] = backend.prepare(bar)
+        if PROFILER.enabled:
+            PROFILER.surfaces += 2 if step else 1
+    return bar
+
+class CachedText:
+    def __init__(self, font, color):
+        self.font = font
+        self.color = color
+        self.value = None
+        self.surf = None
+
+    def get(self, value):
+        if value != self.value:
+            self.value = value
+            self.surf = backend.prepare(self.font.render(value, True, self.color))
+            if PROFILER.enabled:
+                PROFILER.surfaces += 1
+        return self.surf
+
+digits = GlyphAtlas(font)
+hit_digits = GlyphAtlas(hit_font)
+hud_hp_text = CachedText(font, (0, 0, 0))
+hud_arena_text = CachedText(font, (0, 0, 0))
+clear_text = ATLAS.add(big_font.render("Arène terminée !", True, (255, 255, 255)))
+
+def make_arrow():
+    surf = pygame.Surface((21, 41), pygame.SRCALPHA)
+    pygame.draw.polygon(surf, C_ARROW, [(0, 20), (20, 0), (20, 40)])
+    return ATLAS.add(surf)
+
+arrow_img = make_arrow()
 
 # ────────────────────────────────────────────────
 # CLASSES ENTITÉS
 # ────────────────────────────────────────────────
 class Player:
-    def __init__(self):
+    def __init__(self, color=C_PLAYER, x=100):
         self.img = pygame.Surface((84, 144))  # Augmenté (1.5x)
-        self.img.fill(C_PLAYER)
-        self.rect = self.img.get_rect(midbottom=(100, HEIGHT - 40))
+        self.img.fill(color)
+        self.img = backend.prepare(self.img)
+        self.rect = self.img.get_rect(midbottom=(x, HEIGHT - 40))
+        self.prev_pos = self.rect.topleft
         self.vel = pygame.Vector2(0, 0)
         self.on_ground = False
         self.facing = 1
         self.hp = PLAYER_MAX_HP
         self.inv = 0
+        self.immortal = False  # Bancs d'essai : la mort remet les PV au max
 
     def damage(self, dmg, direction):
         if self.inv: return
@@ -180,18 +1531,21 @@ class Player:
         self.inv = INVULN_FRAMES
         self.vel.x, self.vel.y = KNOCKBACK_X * direction, KNOCKBACK_Y
         if self.hp <= 0:
+            if self.immortal:
+                self.hp = PLAYER_MAX_HP
+                return
             pygame.quit(); sys.exit()
 
-    def handle_input(self, bounds):
-        keys = pygame.key.get_pressed()
+    def handle_input(self, bounds, controls):
+        left, right, jump = controls
         self.vel.x = 0
-        if keys[pygame.K_q]:
+        if left:
             if not bounds or self.rect.left - PLAYER_SPEED >= bounds[0]:
                 self.vel.x = -PLAYER_SPEED
-        if keys[pygame.K_d]:
+        if right:
             if not bounds or self.rect.right + PLAYER_SPEED <= bounds[1]:
                 self.vel.x = PLAYER_SPEED
-        if keys[pygame.K_SPACE] and self.on_ground:
+        if jump and self.on_ground:
             self.vel.y = -PLAYER_JUMP
             self.on_ground = False
         if self.vel.x != 0:
@@ -201,16 +1555,19 @@ class Player:
         self.vel.y += GRAVITY
         self.rect.x += self.vel.x
         self._collide('x')
+        prev_bottom = self.rect.bottom
         self.rect.y += self.vel.y
         self.on_ground = False
-        self._collide('y')
+        self._collide('y', prev_bottom)
         self.rect.clamp_ip(pygame.Rect(0, 0, WORLD_WIDTH, HEIGHT))
         if self.inv:
             self.inv -= 1
 
-    def _collide(self, axis):
-        for p in platforms:
+    def _collide(self, axis, prev_bottom=None):
+        for p, one_way in level.near(self.rect.left, self.rect.right):
             if self.rect.colliderect(p):
+                if one_way and (axis == 'x' or self.vel.y <= 0 or prev_bottom > p.top):
+                    continue
                 if axis == 'x':
                     if self.vel.x > 0:
                         self.rect.right = p.left
@@ -226,53 +1583,77 @@ class Player:
                         self.rect.top = p.bottom
                         self.vel.y = 0
 
-    def draw(self, cx):
+    def dirty_rect(self, cx, alpha):
+        x, y = lerp_pos(self, alpha)
+        return pygame.Rect(x - cx, y, self.rect.w, self.rect.h)
+
+    def draw(self, out, cx, alpha=1.0):
         if self.inv == 0 or (self.inv // 4) % 2 == 0:
-            screen.blit(self.img, (self.rect.x - cx, self.rect.y))
+            x, y = lerp_pos(self, alpha)
+            out.blit(self.img, (x - cx, y))
+
+def player_bullet_img():  # rectangle plein, dans l'atlas pour rester dans le lot
+    global _player_bullet
+    if _player_bullet is None:
+        surf = pygame.Surface((24, 12), pygame.SRCALPHA)
+        surf.fill(C_BULLET)
+        _player_bullet = ATLAS.add(surf)
+    return _player_bullet
+
+_player_bullet = None
 
 class Bullet:
     def __init__(self, x, y, vx, owner):
         self.vx = vx
         self.owner = owner
         if owner == 'enemy':
-            self.frames = projectile_frames
-            self.durations = projectile_durations
-            self.current_frame = 0
-            self.frame_time = 0
-            self.img = self.frames[0]
+            self.dir = RIGHT if vx > 0 else LEFT
+            self.anim = Animator(ANIMATIONS["projectile"])
+            self.img = self.anim.frame(self.dir)
             self.rect = self.img.get_rect(center=(x, y))
         else:
             self.rect = pygame.Rect(x, y, 24, 12)  # Augmenté (1.5x)
-            self.img = None
+            self.img = player_bullet_img()
+        self.prev_pos = self.rect.topleft
+        self.life = BULLET_LIFETIME
+        self.start = sim_tick
 
-    def update(self):
+    def update(self, dt):
         self.rect.x += self.vx
+        self.life -= 1
         if self.owner == 'enemy':
-            self.frame_time += 1 / FPS
-            if self.frame_time >= self.durations[int(self.current_frame)]:
-                self.current_frame += 1
-                self.frame_time = 0
-                if self.current_frame >= len(self.frames):
-                    self.current_frame = 0
-            self.img = self.frames[int(self.current_frame)]
-            if self.vx > 0:
-                self.img = pygame.transform.flip(self.img, True, False)
-
-    def draw(self, cx):
-        if self.owner == 'enemy':
-            screen.blit(self.img, (self.rect.x - cx, self.rect.y))
-        else:
-            pygame.draw.rect(screen, C_BULLET,
-                             (self.rect.x - cx, self.rect.y, 24, 12))
+            self.img = self.anim.frame(self.dir)
+
+    def dirty_rect(self, cx, alpha):
+        x, y = lerp_pos(self, alpha)
+        return pygame.Rect(x - cx, y, self.rect.w, self.rect.h).inflate(2, 2)
+
+    def draw(self, out, cx, alpha=1.0):
+        x, y = lerp_pos(self, alpha)
+        out.blit(self.img, (x - cx, y))
 
     def off_screen(self):
         return self.rect.right < 0 or self.rect.left > WORLD_WIDTH
 
+def block_img(color):  # ennemi sans animation : une image par couleur, partagée
+    img = _block_imgs.get(color)
+    if img is None:
+        surf = pygame.Surface((84, 84), pygame.SRCALPHA)  # Augmenté (1.5x)
+        surf.fill(color)
+        img = _block_imgs[color] = ATLAS.add(surf)
+    return img
+
+_block_imgs = {}
+
 class Enemy:
-    def __init__(self, x, y, color, hp, dmg):
-        self.img = pygame.Surface((84, 84))  # Augmenté (1.5x)
-        self.img.fill(color)
-        self.rect = self.img.get_rect(topleft=(x, y))
+    # Objets recyclés (voir EnemyPool) : __init__ n'alloue que ce qui survit
+    # d'une vie à l'autre, spawn() remet tout l'état de jeu à neuf.
+    def __init__(self):
+        self.rect = pygame.Rect(0, 0, 84, 84)
+        self.alive = False
+
+    def spawn(self, x, y, hp, dmg):
+        self.rect.topleft = (x, y)
         self.max_hp = hp
         self.hp = hp
         self.dmg = dmg
@@ -280,385 +1661,2547 @@ class Enemy:
         self.on_ground = False
         self.hit_timer = 0
         self.hit_scale = 1.0
+        self.prev_pos = self.rect.topleft
+        self.ai_ticks = 0  # pas en retard (ordonnanceur d'IA)
+        self.routed = False  # a quitté le sol en suivant le graphe : garde son cap en l'air
 
     def apply_grav(self):
+        prev_bottom = self.rect.bottom
         self.vel_y += GRAVITY
         self.rect.y += self.vel_y
         self.on_ground = False
-        for p in platforms:
-            if self.rect.colliderect(p) and self.vel_y >= 0:
+        for p, one_way in level.near(self.rect.left, self.rect.right):
+            if (self.rect.colliderect(p) and self.vel_y >= 0 and
+                    (not one_way or prev_bottom <= p.top)):
                 self.rect.bottom = p.top
                 self.vel_y = 0
                 self.on_ground = True
 
+    def navigate(self):
+        # Au sol : (surface, direction, saut) d'après le graphe de navigation
+        if not self.on_ground:
+            return None, None, False
+        sid = nav.surface_at(self.rect)
+        route = nav.steer(sid, self.rect.centerx)
+        self.routed = route is not None
+        return (sid, None, False) if route is None else (sid, *route)
+
+    def animate(self, dt):
+        # Hors de l'écran, le gouverneur de qualité espace les changements d'image
+        every = quality.offscreen_anim
+        if (every > 1 and (sim_tick + self.handle) % every and
+                (self.rect.right < cam_x or self.rect.left > cam_x + WIDTH)):
+            return
+        self.step_animation(dt)
+
     def take_hit(self):
         self.hit_timer = 0.3
         self.hit_scale = 2.0
+        if enemies.columns is not None:
+            enemies.columns.on_hit(enemies.index_of(self), self)
 
-    def update(self, player):
+    def update(self, player, dt):
         if self.hit_timer > 0:
-            self.hit_timer -= 1 / FPS
-            self.hit_scale = max(1.0, self.hit_scale - (1.0 / 0.3) * (1 / FPS))
+            self.hit_timer -= dt
+            self.hit_scale = max(1.0, self.hit_scale - (1.0 / 0.3) * dt)
         return not self.despawn()
 
-    def draw(self, cx):
-        screen.blit(self.img, (self.rect.x - cx, self.rect.y))
+    def coast(self, player, ticks, dt):
+        # Hors champ : déplacement seul sur `ticks` pas, sans IA ni animation
+        self.rect.x += self.coast_step(player) * ticks
+        for _ in range(1 if self.on_ground else ticks):
+            self.apply_grav()
+        return Enemy.update(self, player, dt * ticks)
+
+    def coast_step(self, player):
+        return 0
+
+    def bar_width(self):
+        return 84  # Augmenté
+
+    def dirty_rect(self, cx, alpha):
+        x, y = lerp_pos(self, alpha)
+        r = pygame.Rect(x - cx, y, self.img.get_width(), self.img.get_height()).inflate(2, 2)
+        if self.hit_timer > 0:
+            # Barre jusqu'à 2x sa largeur et pourcentage centrés au-dessus du sprite
+            w = self.bar_width()
+            top = y - 36 - hit_digits.height // 2 - 2
+            r.union_ip(pygame.Rect(x - cx - w / 2 - 4, top, 2 * w + 8, y - top))
+        return r
+
+    def draw(self, out, cx, alpha=1.0):
+        x, y = lerp_pos(self, alpha)
+        x -= cx
+        out.blit(self.img, (x, y))
         if self.hit_timer > 0:
-            x = self.rect.x - cx
-            y = self.rect.y - 18  # Ajusté pour plus grand sprite
-            bar_width = 84 * self.hit_scale  # Augmenté
-            bar_height = 12 * self.hit_scale  # Augmenté
-            bar_surf = pygame.Surface((84, 12), pygame.SRCALPHA)
-            pygame.draw.rect(bar_surf, C_BAR_BG, (0, 0, 84, 12))
-            fill = int(84 * self.hp / self.max_hp)
-            pygame.draw.rect(bar_surf, C_BAR, (0, 0, fill, 12))
-            scaled_bar = pygame.transform.scale(bar_surf, (bar_width, bar_height))
-            bar_x = x - (bar_width - 84) / 2
-            bar_y = y - (bar_height - 12) / 2
-            screen.blit(scaled_bar, (bar_x, bar_y))
+            y = y - 18  # Ajusté pour plus grand sprite
+            w = self.bar_width()
+            scale = self.hit_scale if quality.hit_fx else 1.0
+            bar = hit_bar(w, int(w * self.hp / self.max_hp), scale)
+            bar_w, bar_h = bar.get_size()
+            out.blit(bar, (x - (bar_w - w) / 2, y - (bar_h - 12) / 2))
             percentage = int(100 * self.hp / self.max_hp)
-            text = (hit_font if self.hit_scale > 1.0 else font).render(str(percentage), True, (255, 255, 255))
-            shadow = (hit_font if self.hit_scale > 1.0 else font).render(str(percentage), True, (0, 0, 0))
-            text_rect = text.get_rect(center=(x + 42, y - 18))
-            shadow_rect = shadow.get_rect(center=(x + 43, y - 17))
-            screen.blit(shadow, shadow_rect)
-            screen.blit(text, text_rect)
+            (hit_digits if scale > 1.0 else digits).draw(out, percentage, (x + w / 2, y - 18))
 
     def despawn(self):
         return (self.rect.right < -DESPAWN_MARGIN or
                 self.rect.left > WORLD_WIDTH + DESPAWN_MARGIN)
 
 class ShooterEnemy(Enemy):
-    def __init__(self, x, y, direction):
-        super().__init__(x, y, C_SHOOTER, SHO_HP, SHO_DMG)
+    CLIPS = {'idle': ANIMATIONS["shooter_idle"], 'walk': ANIMATIONS["shooter_walk"],
+             'attack': ANIMATIONS["shooter_attack"]}
+
+    def __init__(self):
+        super().__init__()
+        self.anim = Animator(self.CLIPS['idle'])
+
+    @staticmethod
+    def roll():
+        return rng.uniform(*SHO_SPEED_RANGE), rng.randint(*SHO_SHOT_INTERVAL)
+
+    def spawn(self, x, direction, rolled, now):
+        super().spawn(x, GROUND_TOP - 144, SHO_HP, SHO_DMG)
         self.dir = direction
-        self.speed = random.uniform(*SHO_SPEED_RANGE)
-        self.last_shot = pygame.time.get_ticks()
-        self.s_interval = random.randint(*SHO_SHOT_INTERVAL)
+        self.speed, self.s_interval = rolled
+        self.last_shot = now
         self.last_jump = 0
-        self.idle_frames = shooter_idle_frames
-        self.walk_frames = shooter_walk_frames
-        self.attack_frames = shooter_attack_frames
-        self.idle_durations = shooter_idle_durations
-        self.walk_durations = shooter_walk_durations
-        self.attack_durations = shooter_attack_durations
-        self.current_frame = 0
-        self.frame_time = 0
         self.state = 'idle'
         self.attack_timer = 0
-        self.img = self.idle_frames[0]
-        self.rect = self.img.get_rect(topleft=(x, y))
+        self.anim.play(self.CLIPS['idle'], restart=True)
+        self.img = self.anim.frame(self.dir)
+        self.rect.size = self.img.get_size()
 
-    def update(self, player):
-        now = pygame.time.get_ticks()
+    def update(self, player, dt):
+        now = sim_time
         dx = player.rect.centerx - self.rect.centerx
-        if abs(dx) > SHO_SAFE_DIST:
+        sid, route, leap = self.navigate()
+        if route is not None:
+            self.dir = route
+        elif not self.routed and abs(dx) > SHO_SAFE_DIST:
             self.dir = 1 if dx > 0 else -1
         self.state = 'walk' if abs(self.rect.x - (self.rect.x + self.dir * self.speed)) > 0.01 else 'idle'
         if self.attack_timer > 0:
             self.state = 'attack'
-            self.attack_timer -= 1 / FPS
+            self.attack_timer -= dt
         self.rect.x += self.dir * self.speed
-        if not platform_below(self.rect, platforms, self.dir * 6):
+        if route is None and sid is not None and nav.past_edge(sid, self.rect, self.dir):
             self.dir *= -1
-        if (self.on_ground and abs(dx) < 60 and
-            player.rect.centery < self.rect.centery and
-            now - self.last_jump >= SHO_JUMP_CD):
+        if self.on_ground and (leap or abs(dx) < 60 and
+                               player.rect.centery < self.rect.centery and
+                               now - self.last_jump >= SHO_JUMP_CD):
             self.vel_y = -PLAYER_JUMP
             self.on_ground = False
             self.last_jump = now
         if now - self.last_shot >= self.s_interval and abs(dx) < SHO_RANGE:
-            bullets.append(Bullet(self.rect.centerx,
-                                  self.rect.centery,
-                                  6 if dx > 0 else -6,
-                                  'enemy'))
+            self.fire(dx)
             self.last_shot = now
             self.state = 'attack'
             self.attack_timer = 0.5
         self.apply_grav()
-        frames = {
-            'idle': self.idle_frames,
-            'walk': self.walk_frames,
-            'attack': self.attack_frames
-        }[self.state]
-        durations = {
-            'idle': self.idle_durations,
-            'walk': self.walk_durations,
-            'attack': self.attack_durations
-        }[self.state]
-        self.frame_time += 1 / FPS
-        if self.current_frame >= len(frames):
-            self.current_frame = 0
-        if self.frame_time >= durations[int(self.current_frame)]:
-            self.current_frame += 1
-            self.frame_time = 0
-            if self.current_frame >= len(frames):
-                self.current_frame = 0
-        self.img = frames[int(self.current_frame)]
-        if self.dir == 1:
-            self.img = pygame.transform.flip(self.img, True, False)
-        return super().update(player)
+        self.animate(dt)
+        return super().update(player, dt)
+
+    def coast_step(self, player):
+        dx = player.rect.centerx - self.rect.centerx
+        if abs(dx) > SHO_SAFE_DIST:
+            self.dir = 1 if dx > 0 else -1
+        return self.dir * self.speed
+
+    def coast(self, player, ticks, dt):
+        alive = super().coast(player, ticks, dt)
+        if not level.ground_below(self.rect, self.dir * 6):
+            self.dir *= -1
+        return alive
+
+    def fire(self, dx):
+        fire_projectile(self.rect.centerx, self.rect.centery, 6 if dx > 0 else -6, 'enemy')
+
+    def step_animation(self, dt):
+        self.anim.play(self.CLIPS[self.state])
+        self.img = self.anim.frame(self.dir)
 
 class MeleeEnemy(Enemy):
-    def __init__(self, x, y):
-        super().__init__(x, y, C_MELEE, MEL_HP, MEL_DMG)
-        self.speed = random.uniform(*MEL_SPEED_RANGE)
+    # Noms seulement : les clips du second skin (LAZY_ANIMATIONS) ne sont
+    # terminés qu'au premier spawn qui les tire
+    SKINS = (("melee_walk", "melee_idle"), ("melee_2_walk", "melee_2_idle"))
+
+    def __init__(self):
+        super().__init__()
+        self.anim = Animator(ANIMATIONS[self.SKINS[0][1]])
+
+    @staticmethod
+    def roll():
+        return rng.uniform(*MEL_SPEED_RANGE), rng.randrange(len(MeleeEnemy.SKINS))
+
+    def set_skin(self, skin):
+        self.skin = skin
+        walk, idle = self.SKINS[skin]
+        self.walk_clip, self.idle_clip = ANIMATIONS[walk], ANIMATIONS[idle]
+
+    def spawn(self, x, direction, rolled, now):
+        super().spawn(x, GROUND_TOP - 144, MEL_HP, MEL_DMG)
+        self.speed, skin = rolled
+        self.set_skin(skin)
         self.last_jump = 0
-        animation_set = random.choice([
-            (melee_walk_frames, melee_idle_frames, melee_walk_durations, melee_idle_durations),
-            (melee_2_walk_frames, melee_2_idle_frames, melee_2_walk_durations, melee_2_idle_durations)
-        ])
-        self.walk_frames = animation_set[0]
-        self.idle_frames = animation_set[1]
-        self.walk_durations = animation_set[2]
-        self.idle_durations = animation_set[3]
-        self.current_frame = 0
-        self.frame_time = 0
         self.moving = False
         self.facing = 1
-        self.img = self.idle_frames[0]
-        self.rect = self.img.get_rect(topleft=(x, y))
+        self.anim.play(self.idle_clip, restart=True)
+        self.img = self.anim.frame(self.facing)
+        self.rect.size = self.img.get_size()
 
-    def update(self, player):
-        now = pygame.time.get_ticks()
+    def update(self, player, dt):
+        now = sim_time
         dx = player.rect.centerx - self.rect.centerx
-        dir = 1 if dx > 0 else -1
-        self.facing = dir
-        if abs(dx) > MEL_MIN_DIST:
+        _, route, leap = self.navigate()
+        if route is not None or self.routed:
+            dir = self.facing if route is None else route
             self.moving = True
-            self.rect.x += dir * self.speed
         else:
-            self.moving = False
-        if (self.on_ground and
-            not platform_below(self.rect, platforms, dir * MEL_LOOKAHEAD)):
-            self.vel_y = -PLAYER_JUMP
-            self.on_ground = False
-        if (self.on_ground and player.rect.centery < self.rect.centery - 20 and
-            now - self.last_jump >= MEL_JUMP_CD):
+            dir = 1 if dx > 0 else -1
+            self.moving = abs(dx) > MEL_MIN_DIST
+        self.facing = dir
+        if self.moving:
+            self.rect.x += dir * self.speed
+        if self.on_ground and (leap or player.rect.centery < self.rect.centery - 20 and
+                               now - self.last_jump >= MEL_JUMP_CD):
             self.vel_y = -PLAYER_JUMP
             self.on_ground = False
             self.last_jump = now
         self.apply_grav()
-        frames = self.walk_frames if self.moving else self.idle_frames
-        durations = self.walk_durations if self.moving else self.idle_durations
-        self.frame_time += 1 / FPS
-        if self.current_frame >= len(frames):
-            self.current_frame = 0
-        if self.frame_time >= durations[int(self.current_frame)]:
-            self.current_frame += 1
-            self.frame_time = 0
-            if self.current_frame >= len(frames):
-                self.current_frame = 0
-        self.img = frames[int(self.current_frame)]
-        if self.facing == 1:
-            self.img = pygame.transform.flip(self.img, True, False)
-        return super().update(player)
-
-    def draw(self, cx):
-        screen.blit(self.img, (self.rect.x - cx, self.rect.y))
-        if self.hit_timer > 0:
-            x = self.rect.x - cx
-            y = self.rect.y - 18
-            bar_width = self.rect.w * self.hit_scale
-            bar_height = 12 * self.hit_scale
-            bar_surf = pygame.Surface((self.rect.w, 12), pygame.SRCALPHA)
-            pygame.draw.rect(bar_surf, C_BAR_BG, (0, 0, self.rect.w, 12))
-            fill = int(self.rect.w * self.hp / self.max_hp)
-            pygame.draw.rect(bar_surf, C_BAR, (0, 0, fill, 12))
-            scaled_bar = pygame.transform.scale(bar_surf, (bar_width, bar_height))
-            bar_x = x - (bar_width - self.rect.w) / 2
-            bar_y = y - (bar_height - 12) / 2
-            screen.blit(scaled_bar, (bar_x, bar_y))
-            percentage = int(100 * self.hp / self.max_hp)
-            text = (hit_font if self.hit_scale > 1.0 else font).render(str(percentage), True, (255, 255, 255))
-            shadow = (hit_font if self.hit_scale > 1.0 else font).render(str(percentage), True, (0, 0, 0))
-            text_rect = text.get_rect(center=(x + self.rect.w / 2, y - 18))
-            shadow_rect = shadow.get_rect(center=(x + self.rect.w / 2 + 1, y - 17))
-            screen.blit(shadow, shadow_rect)
-            screen.blit(text, text_rect)
+        self.animate(dt)
+        return super().update(player, dt)
+
+    def step_animation(self, dt):
+        self.anim.play(self.walk_clip if self.moving else self.idle_clip)
+        self.img = self.anim.frame(self.facing)
+
+    def coast_step(self, player):
+        self.facing = 1 if player.rect.centerx > self.rect.centerx else -1
+        return self.facing * self.speed
+
+    def bar_width(self):
+        return self.rect.w
 
 class VehicleEnemy(Enemy):
-    def __init__(self, x, direction):
-        super().__init__(x - 120 if direction > 0 else x + 120,  # Ajusté (1.5x)
-                         HEIGHT - 180, C_VEHICLE, VEH_HP, VEH_DMG)  # Ajusté
-        self.speed = direction * random.randint(*VEH_SPEED_RANGE)
+    @staticmethod
+    def roll():
+        return rng.randint(*VEH_SPEED_RANGE)
+
+    def spawn(self, x, direction, rolled, now):
+        super().spawn(x - 120 if direction > 0 else x + 120,  # Ajusté (1.5x)
+                      HEIGHT - 180, VEH_HP, VEH_DMG)  # Ajusté
+        self.img = block_img(C_VEHICLE)
+        self.rect.size = self.img.get_size()
+        self.speed = direction * rolled
 
-    def update(self, player):
+    def update(self, player, dt):
         self.rect.x += self.speed
-        return super().update(player)
+        return super().update(player, dt)
+
+    def coast_step(self, player):
+        return self.speed
+
+    def step_animation(self, dt):
+        pass
+
+# ────────────────────────────────────────────────
+# ORDONNANCEUR D'IA (niveaux de détail)
+# ────────────────────────────────────────────────
+# Ennemis visibles (caméra ± marge) ou proches du joueur : update() complet à
+# chaque tick. Les autres, qui attendent hors champ d'entrer en scène, ne
+# font que cumuler des pas en retard et sont déplacés par coast() tous les
+# AI_FAR_INTERVAL ticks (décalés par identifiant pour lisser la charge), sans
+# IA ni animation. Ce travail différé est servi à tour de rôle dans la limite
+# de budget_ms par tick, en reprenant après le dernier identifiant servi : le
+# reste attend le tick suivant au lieu de faire sauter une frame. Un ennemi
+# qui revient en vue rattrape d'abord son retard. Le budget dépend de
+# l'horloge réelle, donc la partie aussi : il n'existe qu'en jeu, sur demande
+# (--ai-budget), jamais sans fenêtre ni avec --record, pour que bancs
+# d'essai, équilibrage et rejeux restent des charges fixes. --no-ai-lod
+# remet tout le monde en IA complète (comparaisons A/B, parité NumPy).
+AI_NEAR_MARGIN   = 64    # px hors écran encore traités comme visibles
+AI_PLAYER_RADIUS = 400   # px autour du joueur toujours en IA complète
+AI_FAR_INTERVAL  = 4     # ticks entre deux déplacements hors champ
+AI_BUDGET_MS     = None  # travail différé max par tick (None : illimité)
+
+class AIScheduler:
+    def __init__(self, budget_ms=AI_BUDGET_MS, far_interval=AI_FAR_INTERVAL, lod=True):
+        self.budget_ms = budget_ms
+        self.lod = lod
+        self.far_interval = far_interval
+        self.cursor = 0  # dernier identifiant servi (0 : depuis le début)
+        self.full = 0
+        self.coasted = 0
+        self.deferred = 0
+
+    def update(self, store, player, dt):
+        left = cam_x - AI_NEAR_MARGIN
+        right = cam_x + WIDTH + AI_NEAR_MARGIN
+        px = player.rect.centerx
+        far = []
+        for e in store:
+            if e.rect.right < cam_x - DESPAWN_MARGIN:
+                store.destroy(e)
+                trickle_respawn()
+                continue
+            if (not self.lod or (e.rect.right >= left and e.rect.left <= right) or
+                    abs(e.rect.centerx - px) <= AI_PLAYER_RADIUS):
+                if e.ai_ticks and not e.coast(player, e.ai_ticks, dt):
+                    store.destroy(e)
+                    continue
+                e.ai_ticks = 0
+                if not e.update(player, dt):
+                    store.destroy(e)
+            else:
+                e.ai_ticks += 1
+                if e.ai_ticks > self.far_interval or (sim_tick + e.handle) % self.far_interval == 0:
+                    far.append(e)
+        self.full = len(store) - len(far)
+        self.coasted = self.deferred = 0
+        if not far:
+            return
+        deadline = None
+        if self.budget_ms is not None:
+            deadline = time.perf_counter() + self.budget_ms / 1000
+            cursor = self.cursor
+            far.sort(key=lambda e: (e.handle <= cursor, e.handle))
+        for k, e in enumerate(far):
+            if k and deadline is not None and time.perf_counter() > deadline:
+                # Budget épuisé : on reprendra après le dernier servi
+                self.deferred = len(far) - k
+                return
+            if not e.coast(player, e.ai_ticks, dt):
+                store.destroy(e)
+            e.ai_ticks = 0
+            self.coasted += 1
+            self.cursor = e.handle
+        self.cursor = 0
+
+ai_scheduler = AIScheduler(
+    None if HEADLESS or cli_args.record else cli_args.ai_budget or AI_BUDGET_MS or None,
+    lod=not cli_args.no_ai_lod)
+
+# ────────────────────────────────────────────────
+# MOTEUR VECTORISÉ DES ENNEMIS (NumPy, optionnel)
+# ────────────────────────────────────────────────
+# Avec --numpy, position, vitesse, direction, sol, délais de saut/tir et
+# minuteurs de coup vivent dans des tableaux alignés sur enemies.items.
+# Poursuite, sol devant, sauts, gravité, plateformes et sorties de carte
+# sont calculés en une passe par tick ; les objets restent des vues tenues
+# à jour pour le dessin, les collisions, les tirs et l'animation.
+KIND_SHOOTER, KIND_MELEE, KIND_VEHICLE = 0, 1, 2
+
+def _round_rect(v):
+    # Comme Rect : flottant arrondi au plus proche, 0.5 loin de zéro
+    return np.copysign(np.floor(np.abs(v) + 0.5), v)
+
+class EnemyBatch:
+    SHOOTER_STATES = ('idle', 'walk', 'attack')
+    FIELDS = ("x", "y", "w", "h", "vel_y", "speed", "dir", "last_jump", "last_shot",
+              "s_interval", "attack_timer", "hit_timer", "hit_scale")
+
+    def __init__(self, capacity=256):
+        self.n = 0
+        self.capacity = capacity
+        for name in self.FIELDS:
+            setattr(self, name, np.zeros(capacity))
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.on_ground = np.zeros(capacity, dtype=bool)
+        self.routed = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        self.capacity *= 2
+        for name in self.FIELDS + ("kind", "on_ground", "routed"):
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def append(self, e):
+        if self.n == self.capacity:
+            self._grow()
+        i = self.n
+        self.n += 1
+        self.x[i], self.y[i], self.w[i], self.h[i] = e.rect
+        self.vel_y[i] = e.vel_y
+        self.on_ground[i] = e.on_ground
+        self.routed[i] = e.routed
+        self.hit_timer[i] = e.hit_timer
+        self.hit_scale[i] = e.hit_scale
+        self.speed[i] = e.speed
+        if isinstance(e, ShooterEnemy):
+            self.kind[i] = KIND_SHOOTER
+            self.dir[i] = e.dir
+            self.last_jump[i] = e.last_jump
+            self.last_shot[i] = e.last_shot
+            self.s_interval[i] = e.s_interval
+            self.attack_timer[i] = e.attack_timer
+        elif isinstance(e, MeleeEnemy):
+            self.kind[i] = KIND_MELEE
+            self.dir[i] = e.facing
+            self.last_jump[i] = e.last_jump
+        else:
+            self.kind[i] = KIND_VEHICLE
+
+    def swap_remove(self, i):
+        last = self.n - 1
+        if i != last:
+            for name in self.FIELDS + ("kind", "on_ground", "routed"):
+                arr = getattr(self, name)
+                arr[i] = arr[last]
+        self.n = last
+
+    def clear(self):
+        self.n = 0
+
+    def on_hit(self, i, e):
+        self.hit_timer[i] = e.hit_timer
+        self.hit_scale[i] = e.hit_scale
+
+    def set_shot_interval(self, i, interval):
+        self.s_interval[i] = interval
+
+    def update(self, store, player, dt, now, cam_left):
+        n = self.n
+        x, y, w, h = self.x[:n], self.y[:n], self.w[:n], self.h[:n]
+        vy, og, d = self.vel_y[:n], self.on_ground[:n], self.dir[:n]
+        last_jump, last_shot = self.last_jump[:n], self.last_shot[:n]
+        attack, hit_t, hit_s = self.attack_timer[:n], self.hit_timer[:n], self.hit_scale[:n]
+        kind = self.kind[:n]
+        sho, mel, veh = kind == KIND_SHOOTER, kind == KIND_MELEE, kind == KIND_VEHICLE
+
+        # Sortie par la gauche de la caméra, testée avant la mise à jour
+        gone = x + w < cam_left - DESPAWN_MARGIN
+
+        dx = player.rect.centerx - (x + w // 2)
+        adx = np.abs(dx)
+        side = np.where(dx > 0, 1.0, -1.0)
+        # Graphe de navigation : cap et sauts des ennemis au sol hors de la
+        # surface du joueur ; en l'air, qui suivait une route garde son cap
+        sid = nav.surfaces_of(x, y + h, w, og & (sho | mel))
+        routed, want, leap = nav.steer_arrays(sid, x + w // 2)
+        airborne = self.routed[:n] & ~og
+        self.routed[:n] = np.where(og, routed, self.routed[:n])
+        d[:] = np.where(routed, want, np.where(mel & ~airborne | (sho & ~airborne & (adx > SHO_SAFE_DIST)),
+                                               side, d))
+        moving = mel & (routed | airborne | (adx > MEL_MIN_DIST))
+        attacking = sho & (attack > 0)
+        attack[attacking] -= dt
+        step = np.where(veh, self.speed[:n], np.where(sho | moving, d * self.speed[:n], 0.0))
+        x[:] = _round_rect(x + step)
+
+        if len(nav.surfaces):
+            edge = sho & ~routed & (sid >= 0)
+            edge &= ((x + d * 6 >= nav.right[sid]) | (x + w + d * 6 <= nav.left[sid]))
+            d[edge] *= -1
+
+        cy = y + h // 2
+        py = player.rect.centery
+        jump = og & ((sho & (leap | (adx < 60) & (py < cy) & (now - last_jump >= SHO_JUMP_CD))) |
+                     (mel & (leap | (py < cy - 20) & (now - last_jump >= MEL_JUMP_CD))))
+        vy[jump] = -PLAYER_JUMP
+        og[jump] = False
+        last_jump[jump] = now
+
+        fire = sho & ~gone & (now - last_shot >= self.s_interval[:n]) & (adx < SHO_RANGE)
+        last_shot[fire] = now
+        attack[fire] = 0.5
+
+        grav = sho | mel
+        vy[grav] += GRAVITY
+        y_before = y.copy()
+        y[:] = np.where(grav, _round_rect(y + vy), y)
+        og[grav] = False
+        x_min, x_max = (float(x.min()), float((x + w).max())) if n else (0, 0)
+        for p, one_way in level.near(x_min, x_max):
+            land = grav & (vy >= 0) & (x < p.right) & (x + w > p.left) & (y < p.bottom) & (y + h > p.top)
+            if one_way:
+                land &= y_before + h <= p.top
+            y[land] = p.top - h[land]
+            vy[land] = 0
+            og[land] = True
+
+        hit = hit_t > 0
+        hit_t[hit] -= dt
+        hit_s[hit] = np.maximum(1.0, hit_s[hit] - (1.0 / 0.3) * dt)
+        out = (x + w < -DESPAWN_MARGIN) | (x > WORLD_WIDTH + DESPAWN_MARGIN)
+
+        # Événements rares traités à part : sorties, tirs, barres de vie
+        items = store.items[:n]
+        for i in np.flatnonzero(gone | out).tolist():
+            store.destroy(items[i])
+            if gone[i]:
+                trickle_respawn()
+        for i in np.flatnonzero(fire).tolist():
+            e = items[i]
+            e.rect.topleft = (int(x[i]), int(y_before[i]))
+            e.dir = int(d[i])
+            e.fire(dx[i])
+        for i in np.flatnonzero(hit).tolist():
+            items[i].hit_timer = float(hit_t[i])
+            items[i].hit_scale = float(hit_s[i])
+
+        # Réécriture minimale pour le dessin, les collisions et l'animation ;
+        # le reste n'est recopié que sur demande (sync_objects)
+        state = np.where(sho, np.where(attacking | fire, 2, 1), moving).tolist()
+        for e, xi, yi, di, si, k in zip(items, x.astype(np.int64).tolist(),
+                                        y.astype(np.int64).tolist(), d.astype(np.int64).tolist(),
+                                        state, kind.tolist()):
+            if not e.alive:
+                continue
+            e.rect.x = xi
+            e.rect.y = yi
+            if k == KIND_SHOOTER:
+                e.dir = di
+                e.state = self.SHOOTER_STATES[si]
+            elif k == KIND_MELEE:
+                e.facing = di
+                e.moving = si == 1
+            else:
+                continue
+            e.animate(dt)
+
+    def sync_objects(self, store):
+        for i, e in enumerate(store.items[:self.n]):
+            e.vel_y = float(self.vel_y[i])
+            e.on_ground = bool(self.on_ground[i])
+            e.routed = bool(self.routed[i])
+            e.hit_timer = float(self.hit_timer[i])
+            e.hit_scale = float(self.hit_scale[i])
+            if self.kind[i] == KIND_SHOOTER:
+                e.last_jump = float(self.last_jump[i])
+                e.last_shot = float(self.last_shot[i])
+                e.attack_timer = float(self.attack_timer[i])
+            elif self.kind[i] == KIND_MELEE:
+                e.last_jump = float(self.last_jump[i])
+
+# ────────────────────────────────────────────────
+# PROJECTILES VECTORISÉS (NumPy)
+# ────────────────────────────────────────────────
+# Avec --numpy les balles ne sont plus des objets : propriétaire, position,
+# vitesse, durée de vie et départ d'animation vivent dans des tableaux
+# préalloués, les cases libérées passent par une free-list. Déplacement,
+# sortie du monde et collisions (joueur, boîtes des ennemis) se font sur
+# tableaux, et toutes les balles partent dans un seul lot de blits. Comme
+# update_bullets(), les touches se règlent dans l'ordre de tir (seq, le
+# pendant des identifiants de Bullet) et une balle frappe l'ennemi vivant au
+# plus petit identifiant : les deux moteurs consomment les mêmes balles.
+OWNER_PLAYER, OWNER_ENEMY = 0, 1
+
+class ProjectileView:  # lecture seule : empreinte d'état, bot d'équilibrage
+    __slots__ = ("rect", "vx", "owner")
+
+    def __init__(self, rect, vx, owner):
+        self.rect = rect
+        self.vx = vx
+        self.owner = owner
+
+class ProjectilePool:
+    FIELDS = ("x", "y", "prev_x", "prev_y", "vx", "w", "h", "life", "start", "seq")
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        for name in self.FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=np.int64))
+        self.owner = np.zeros(capacity, dtype=np.int8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))  # plus petit indice en dernier
+        self.top = 0    # au-delà, aucune case n'a jamais servi
+        self.count = 0
+        self.next_seq = 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in np.flatnonzero(self.alive[:self.top]):
+            yield ProjectileView(pygame.Rect(int(self.x[i]), int(self.y[i]), int(self.w[i]), int(self.h[i])),
+                                 int(self.vx[i]), 'enemy' if self.owner[i] == OWNER_ENEMY else 'player')
+
+    def _grow(self):
+        old_cap = self.capacity
+        self.capacity *= 2
+        for name in self.FIELDS + ("owner", "alive"):
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:old_cap] = old
+            setattr(self, name, new)
+        self.free[:0] = range(self.capacity - 1, old_cap - 1, -1)
+
+    def spawn(self, x, y, vx, owner):
+        if not self.free:
+            self._grow()
+        i = self.free.pop()
+        self.top = max(self.top, i + 1)
+        if owner == 'enemy':
+            w, h = anim_frame("projectile", LEFT, 0).get_size()
+            x, y = x - w // 2, y - h // 2  # centré, comme Bullet
+            self.owner[i] = OWNER_ENEMY
+        else:
+            w, h = 24, 12
+            self.owner[i] = OWNER_PLAYER
+        self.x[i] = self.prev_x[i] = x
+        self.y[i] = self.prev_y[i] = y
+        self.vx[i], self.w[i], self.h[i] = vx, w, h
+        self.life[i] = BULLET_LIFETIME
+        self.start[i] = sim_tick
+        self.seq[i] = self.next_seq
+        self.next_seq += 1
+        self.alive[i] = True
+        self.count += 1
+
+    def release(self, idx):
+        self.alive[idx] = False
+        self.free.extend(idx.tolist())
+        self.count -= len(idx)
+
+    def clear(self):
+        self.alive[:] = False
+        self.free = list(range(self.capacity - 1, -1, -1))
+        self.top = 0
+        self.count = 0
+        self.next_seq = 1
+
+    reset = clear
+
+    def load(self, idx, fields, owner, released, top, next_seq):  # retour arrière : mêmes cases, même ordre de réemploi
+        while self.capacity < top:
+            self._grow()
+        self.clear()
+        for name, values in fields.items():
+            getattr(self, name)[idx] = values
+        self.owner[idx] = owner
+        self.alive[idx] = True
+        self.free = list(range(self.capacity - 1, top - 1, -1)) + released  # jamais servies, puis libérées
+        self.top = top
+        self.count = len(idx)
+        self.next_seq = next_seq
+
+    def flush(self):  # libération immédiate : rien de différé
+        pass
+
+    def begin_tick(self):
+        n = self.top
+        self.prev_x[:n] = self.x[:n]
+        self.prev_y[:n] = self.y[:n]
+
+    def update(self, targets, store):
+        n = self.top
+        alive = self.alive[:n]
+        x, y, w, h = self.x[:n], self.y[:n], self.w[:n], self.h[:n]
+        vx, life, owner = self.vx[:n], self.life[:n], self.owner[:n]
+        np.add(x, vx, out=x, where=alive)
+        np.subtract(life, 1, out=life, where=alive)
+        self.release(np.flatnonzero(alive & ((x + w < 0) | (x > WORLD_WIDTH) | (life <= 0))))
+
+        # Balles ennemies contre le(s) joueur(s)
+        for p in targets:
+            r = p.rect
+            hits = np.flatnonzero(alive & (owner == OWNER_ENEMY) & (x < r.right) & (x + w > r.left) &
+                                  (y < r.bottom) & (y + h > r.top))
+            hits = hits[np.argsort(self.seq[hits])]
+            for i in hits:
+                p.damage(1, -1 if vx[i] > 0 else 1)
+            self.release(hits)
+
+        # Balles du joueur contre les boîtes des ennemis (colonnes d'EnemyBatch)
+        shots = np.flatnonzero(alive & (owner == OWNER_PLAYER))
+        cols = store.columns
+        if not len(shots) or not cols.n:
+            return
+        shots = shots[np.argsort(self.seq[shots])]
+        m = cols.n
+        sx, sy = x[shots, None], y[shots, None]
+        touch = ((sx < cols.x[:m] + cols.w[:m]) & (sx + w[shots, None] > cols.x[:m]) &
+                 (sy < cols.y[:m] + cols.h[:m]) & (sy + h[shots, None] > cols.y[:m]))
+        spent = []
+        for row in np.flatnonzero(touch.any(axis=1)):
+            e = min((store.items[j] for j in np.flatnonzero(touch[row]) if store.items[j].alive),
+                    key=_by_handle, default=None)
+            if e is not None:
+                e.hp -= 1
+                e.take_hit()
+                spent.append(shots[row])
+                if e.hp <= 0:
+                    store.destroy(e)
+        self.release(np.array(spent, dtype=np.intp))
+
+    def positions(self, idx, cx, alpha):
+        x = self.prev_x[idx] + (self.x[idx] - self.prev_x[idx]) * alpha - cx
+        y = self.prev_y[idx] + (self.y[idx] - self.prev_y[idx]) * alpha
+        return x, y
+
+    def frames(self, idx):
+        # Image de chaque balle ennemie : même calcul que Clip.frame_index, vectorisé
+        clip = ANIMATIONS["projectile"]
+        ms = (sim_tick - self.start[idx]) * 1000 // SIM_HZ % clip.length
+        return np.searchsorted(clip.ends, ms, side="right")
+
+    def draw(self, out, cx, alpha):
+        idx = np.flatnonzero(self.alive[:self.top])
+        if not len(idx):
+            return
+        x, y = self.positions(idx, cx, alpha)
+        clip = ANIMATIONS["projectile"]
+        sheet = clip.frames[LEFT] + clip.frames[RIGHT] + [player_bullet_img()]
+        pick = np.where(self.owner[idx] == OWNER_PLAYER, len(sheet) - 1,
+                        self.frames(idx) + np.where(self.vx[idx] > 0, len(clip.frames[LEFT]), 0))
+        out.blits([sheet[k] for k in pick.tolist()], list(zip(x.tolist(), y.tolist())))
+
+    def dirty_rects(self, cx, alpha):
+        idx = np.flatnonzero(self.alive[:self.top])
+        x, y = self.positions(idx, cx, alpha)
+        return [pygame.Rect(bx, by, bw, bh).inflate(2, 2)
+                for bx, by, bw, bh in zip(x.tolist(), y.tolist(), self.w[idx].tolist(), self.h[idx].tolist())]
+
+# ────────────────────────────────────────────────
+# POOLS D'ENNEMIS & ORDONNANCEUR D'APPARITIONS
+# ────────────────────────────────────────────────
+# Les ennemis sont recyclés : l'EntityStore rend au pool ceux qu'il retire,
+# spawn() les remet en jeu sans allocation, et reset_game() remplit les pools
+# d'avance. spawn_wave() ne fait que les tirages aléatoires, dans l'ordre
+# d'origine, et met les ennemis en file ; SpawnScheduler.update() les sort
+# du pool dans cet ordre, dans la limite de budget_ms par appel, le reste au
+# tick suivant. Le budget dépend de l'horloge réelle : il ne sert qu'en jeu.
+# Sans fenêtre (bancs d'essai, équilibrage, rejeux) et avec --record, la file
+# est vidée dans le tick : mêmes parties qu'avant, à l'identique.
+SPAWN_BUDGET_MS = 1.0   # instanciation max par appel (None : illimité)
+ENEMY_PREWARM   = ((ShooterEnemy, 12), (MeleeEnemy, 12), (VehicleEnemy, 4))
+
+class EnemyPool:
+    def __init__(self):
+        self.free = {}
+        self.allocated = 0
+
+    def prewarm(self, counts):
+        for cls, n in counts:
+            free = self.free.setdefault(cls, [])
+            while len(free) < n:
+                free.append(cls())
+                self.allocated += 1
+
+    def acquire(self, cls):
+        free = self.free.get(cls)
+        if free:
+            return free.pop()
+        self.allocated += 1
+        return cls()
+
+    def release(self, ent):
+        self.free.setdefault(type(ent), []).append(ent)
+
+class SpawnScheduler:
+    def __init__(self, store, pool, budget_ms=SPAWN_BUDGET_MS):
+        self.store = store
+        self.pool = pool
+        self.budget_ms = budget_ms
+        self.queue = deque()
+
+    def push(self, cls, x, direction, rolled):
+        self.queue.append((cls, x, direction, rolled, sim_time))
+
+    def update(self):
+        self._spawn_until(None if self.budget_ms is None else
+                          time.perf_counter() + self.budget_ms / 1000)
+
+    def flush(self):  # bancs d'essai : toute la file, tout de suite
+        self._spawn_until(None)
+
+    def _spawn_until(self, deadline):
+        queue = self.queue
+        while queue:
+            cls, x, direction, rolled, now = queue.popleft()
+            ent = self.pool.acquire(cls)
+            ent.spawn(x, direction, rolled, now)
+            self.store.add(ent)
+            if deadline is not None and time.perf_counter() > deadline:
+                return  # la suite au prochain appel, dans le même ordre
+
+    def cancel(self):
+        self.queue.clear()
+
+    def __len__(self):
+        return len(self.queue)
 
 # ────────────────────────────────────────────────
 # FONCTION DE SPAWN D'UNE VAGUE
 # ────────────────────────────────────────────────
 def spawn_wave(w, left, right, is_arena=False):
-    for _ in range(w["s"]):
-        side = random.choice(['left', 'right'])
-        x = left - SPAWN_MARGIN if side == 'left' else right + SPAWN_MARGIN
-        enemies.append(ShooterEnemy(x, platforms[0].top - 144, 1 if side == 'left' else -1))
-    for _ in range(w["m"]):
-        side = random.choice(['left', 'right'])
-        x = left - SPAWN_MARGIN if side == 'left' else right + SPAWN_MARGIN
-        enemies.append(MeleeEnemy(x, platforms[0].top - 144))
-    for _ in range(w["v"]):
-        side = random.choice(['left', 'right'])
-        x = left - SPAWN_MARGIN if side == 'left' else right + SPAWN_MARGIN
-        enemies.append(VehicleEnemy(x, 1 if side == 'left' else -1))
+    for cls, count in ((ShooterEnemy, w["s"]), (MeleeEnemy, w["m"]), (VehicleEnemy, w["v"])):
+        for _ in range(count):
+            side = rng.choice(['left', 'right'])
+            x = left - SPAWN_MARGIN if side == 'left' else right + SPAWN_MARGIN
+            spawner.push(cls, x, 1 if side == 'left' else -1, cls.roll())
 
 # ────────────────────────────────────────────────
 # INITIALISATION ÉTAT GLOBAL
 # ────────────────────────────────────────────────
-player = Player()
-bullets = []
-enemies = []
+bullets = ProjectilePool() if USE_NUMPY else EntityStore()
+enemy_pool = EnemyPool()
+enemies = EntityStore(EnemyBatch() if USE_NUMPY else None, recycle=enemy_pool.release)
+spawner = SpawnScheduler(enemies, enemy_pool,
+                         None if HEADLESS or cli_args.record else SPAWN_BUDGET_MS)
+net_host = None  # NetHost en co-op : le partenaire joue ses entrées reçues
+partner = None
+
+def reset_game(seed=None):
+    global player, arena_idx, arena_locked, arena_bounds, pending_waves, clear_timer
+    global show_arrow, camera_transition, transition_timer, start_cam_x
+    global non_arena_spawn_timer, cam_x, prev_cam_x, pending_shots, controls, sim_time, sim_tick
+    global game_seed, partner
+    game_seed = random.randrange(2 ** 32) if seed is None else seed
+    rng.seed(game_seed)
+    player = Player()
+    if net_host is not None:
+        partner = Player(C_PLAYER2, 160)
+        partner.immortal = True  # à terre, le partenaire repart avec tous ses PV
+    bullets.reset()
+    enemies.reset()
+    spawner.cancel()
+    enemy_pool.prewarm(ENEMY_PREWARM)
+    arena_idx = 0
+    arena_locked = None
+    arena_bounds = None
+    pending_waves = []
+    clear_timer = 0
+    show_arrow = False
+    camera_transition = False
+    transition_timer = 0
+    start_cam_x = 0
+    non_arena_spawn_timer = rng.uniform(2, 5)
+    cam_x = 0
+    prev_cam_x = 0
+    pending_shots = 0
+    controls = (False, False, False)  # gauche, droite, saut
+    sim_time = 0
+    sim_tick = 0
+    world.update(cam_x)
 
-arena_idx = 0
-arena_locked = None
-arena_bounds = None
-pending_waves = []
-clear_timer = 0
-show_arrow = False
-camera_transition = False
-transition_timer = 0
-start_cam_x = 0
-non_arena_spawn_timer = random.uniform(2, 5)
+reset_game()
 
-def fire_bullet():
-    bullets.append(Bullet(player.rect.centerx + player.facing * 45,  # Ajusté (1.5x)
-                          player.rect.centery,
-                          player.facing * BULLET_SPEED,
-                          'player'))
+def fire_bullet(shooter=None):
+    shooter = shooter or player
+    fire_projectile(shooter.rect.centerx + shooter.facing * 45,  # Ajusté (1.5x)
+                    shooter.rect.centery, shooter.facing * BULLET_SPEED, 'player')
+
+def players():
+    return (player,) if partner is None else (player, partner)
+
+def fire_projectile(x, y, vx, owner):
+    if USE_NUMPY:
+        bullets.spawn(x, y, vx, owner)
+    else:
+        bullets.add(Bullet(x, y, vx, owner))
+
+def keyboard_controls():
+    keys = pygame.key.get_pressed()
+    return keys[pygame.K_q], keys[pygame.K_d], keys[pygame.K_SPACE]
 
 # ────────────────────────────────────────────────
-# BOUCLE PRINCIPALE ASYNC
+# ENREGISTREMENT DES ENTRÉES
 # ────────────────────────────────────────────────
-async def main():
+# simulate() note, tick par tick, les commandes et les tirs en attente. Avec
+# la graine de reset_game(), ce journal suffit à rejouer la partie à
+# l'identique (voir replay()) : une charge fixe pour profiler et comparer.
+# L'empreinte trie ennemis et balles : l'ordre des conteneurs (cases du pool
+# NumPy, retraits par échange) ne dépend que du moteur, pas de la partie.
+REPLAY_FORMAT = 2
+
+class InputLog:
+    def __init__(self, seed, ticks=None, digest=None, ai_lod=True):
+        self.seed = seed
+        self.ticks = ticks if ticks is not None else []
+        self.digest = digest
+        self.ai_lod = ai_lod
+
+    def record(self, tick_controls, shots):
+        left, right, jump = tick_controls
+        self.ticks.append(left | right << 1 | jump << 2 | shots << 3)
+
+    def __iter__(self):
+        for packed in self.ticks:
+            yield (bool(packed & 1), bool(packed & 2), bool(packed & 4)), packed >> 3
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"format": REPLAY_FORMAT, "seed": self.seed, "sim_hz": SIM_HZ,
+                       "numpy": enemies.columns is not None, "level": cli_args.level,
+                       "level_signature": level_signature(cli_args.level),
+                       "ai_lod": ai_scheduler.lod and enemies.columns is None,  # NumPy : IA complète
+                       "digest": self.digest, "ticks": self.ticks}, f)
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("format") != REPLAY_FORMAT or data["sim_hz"] != SIM_HZ:
+            raise ValueError(f"{path} : enregistrement incompatible")
+        # Le monde est ouvert à l'import : un autre niveau ne se rattrape pas ici
+        if data["ai_lod"] and USE_NUMPY:
+            raise ValueError(f"{path} : enregistré avec le LOD d'IA, que le moteur NumPy n'a pas "
+                             f"(rejouer sans --numpy, ou enregistrer avec --no-ai-lod)")
+        if data["level_signature"] != level_signature(cli_args.level):
+            raise ValueError(f"{path} : enregistré sur un autre niveau "
+                             f"(--level {data.get('level') or '(aucun)'})")
+        return InputLog(data["seed"], data["ticks"], data.get("digest"), data["ai_lod"])
+
+recorder = None
+
+def state_digest():
+    state = (sim_time, arena_idx, cam_x, tuple(player.rect), player.hp, tuple(player.vel),
+             sorted((type(e).__name__, tuple(e.rect), e.hp) for e in enemies),
+             sorted((tuple(b.rect), b.vx) for b in bullets), rng.getstate())
+    return f"{zlib.crc32(repr(state).encode()):08x}"
+
+# ────────────────────────────────────────────────
+# SIMULATION À PAS FIXE
+# ────────────────────────────────────────────────
+def update_arena(dt):
     global arena_idx, arena_locked, arena_bounds, pending_waves, clear_timer, show_arrow
     global camera_transition, transition_timer, start_cam_x, non_arena_spawn_timer
-    while True:
-        clock.tick(FPS)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit(); sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                fire_bullet()
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_KP0:
-                fire_bullet()
-
-        if arena_idx < len(ARENAS):
-            if player.rect.centerx >= ARENAS[arena_idx]["x"] and arena_locked is None:
-                enemies.clear()
-                arena_locked = max(0, player.rect.centerx - WIDTH // 2)
-                arena_bounds = (arena_locked, arena_locked + ARENAS[arena_idx]["width"])
-                pending_waves = list(ARENAS[arena_idx]["waves"])
-                spawn_wave(pending_waves.pop(0), arena_bounds[0], arena_bounds[1], is_arena=True)
-
-        if arena_locked and not enemies and not pending_waves:
-            clear_timer += 1
-            show_arrow = (clear_timer // 20) % 2 == 0
-            if clear_timer >= 120:
-                arena_locked = None
-                arena_bounds = None
-                arena_idx += 1
-                camera_transition = True
-                transition_timer = 0.5
-                start_cam_x = cam_x
-                clear_timer = 0
-                show_arrow = False
-
-        if arena_locked and not enemies and pending_waves:
+    arena = world.arena(arena_idx)
+    if arena is not None:
+        if player.rect.centerx >= arena["x"] and arena_locked is None:
+            enemies.clear()
+            spawner.cancel()
+            arena_locked = max(0, player.rect.centerx - WIDTH // 2)
+            arena_bounds = (arena_locked, arena_locked + arena["width"])
+            pending_waves = list(arena["waves"])
             spawn_wave(pending_waves.pop(0), arena_bounds[0], arena_bounds[1], is_arena=True)
 
-        if arena_locked is None:
-            non_arena_spawn_timer -= 1 / FPS
-            if non_arena_spawn_timer <= 0:
-                wave = {"s": random.randint(0, 1), "m": random.randint(1, 2), "v": random.randint(0, 1)}
-                spawn_wave(wave, cam_x, cam_x + WIDTH)
-                non_arena_spawn_timer = random.uniform(2, 5)
+    if arena_locked and not enemies and not spawner and not pending_waves:
+        clear_timer += 1
+        show_arrow = (clear_timer // 20) % 2 == 0
+        if clear_timer >= 120:
+            arena_locked = None
+            arena_bounds = None
+            arena_idx += 1
+            camera_transition = True
+            transition_timer = 0.5
+            start_cam_x = cam_x
+            clear_timer = 0
+            show_arrow = False
 
-        player.handle_input(arena_bounds)
-        player.update()
+    if arena_locked and not enemies and not spawner and pending_waves:
+        spawn_wave(pending_waves.pop(0), arena_bounds[0], arena_bounds[1], is_arena=True)
 
-        for e in enemies[:]:
-            if e.rect.right < cam_x - DESPAWN_MARGIN:
-                enemies.remove(e)
-                wave = {"s": random.randint(0, 1), "m": random.randint(0, 1), "v": random.randint(0, 1)}
-                spawn_wave(wave, cam_x + WIDTH, cam_x + WIDTH + SPAWN_MARGIN)
+    if arena_locked is None:
+        non_arena_spawn_timer -= dt
+        if non_arena_spawn_timer <= 0:
+            wave = {"s": rng.randint(0, 1), "m": rng.randint(1, 2), "v": rng.randint(0, 1)}
+            spawn_wave(wave, cam_x, cam_x + WIDTH)
+            non_arena_spawn_timer = rng.uniform(2, 5)
+
+def update_player(dt):
+    global pending_shots
+    while pending_shots:
+        fire_bullet()
+        pending_shots -= 1
+    player.handle_input(arena_bounds, controls)
+    player.update()
+    if partner is not None:
+        partner_controls, shots = net_host.next_input()
+        for _ in range(shots):
+            fire_bullet(partner)
+        partner.handle_input(arena_bounds, partner_controls)
+        partner.update()
+        # La caméra suit l'hôte : le partenaire reste dans le champ
+        partner.rect.clamp_ip(pygame.Rect(int(cam_x), 0, WIDTH, HEIGHT))
+
+def trickle_respawn():
+    wave = {"s": rng.randint(0, 1), "m": rng.randint(0, 1), "v": rng.randint(0, 1)}
+    spawn_wave(wave, cam_x + WIDTH, cam_x + WIDTH + SPAWN_MARGIN)
+
+def update_enemies(dt):
+    nav.track(player)
+    spawner.update()
+    if enemies.columns is not None:
+        enemies.columns.update(enemies, player, dt, sim_time, cam_x)
+    else:
+        ai_scheduler.update(enemies, player, dt)
+    spawner.update()  # remplaçants de ceux sortis par la gauche, pris en compte dès ce tick
+    enemy_broadphase.rebuild(enemies.items)
+    for p in players():
+        for e in enemy_broadphase.query(p.rect):
+            if e.alive and e.rect.colliderect(p.rect):
+                direction = -1 if e.rect.centerx > p.rect.centerx else 1
+                p.damage(e.dmg, direction)
+
+def update_bullets(dt):
+    if USE_NUMPY:
+        bullets.update(players(), enemies)
+        return
+    # Ordre de tir, puis ennemi au plus petit identifiant : le même que ProjectilePool
+    for b in sorted(bullets, key=_by_handle):
+        b.update(dt)
+        if b.off_screen() or b.life <= 0:
+            bullets.destroy(b)
+            continue
+        if b.owner == 'player':
+            e = min((e for e in enemy_broadphase.query(b.rect) if e.alive and b.rect.colliderect(e.rect)),
+                    key=_by_handle, default=None)
+            if e is not None:
+                e.hp -= 1
+                e.take_hit()
+                bullets.destroy(b)
+                if e.hp <= 0:
+                    enemies.destroy(e)
+        else:
+            for p in players():
+                if b.rect.colliderect(p.rect):
+                    direction = -1 if b.vx > 0 else 1
+                    p.damage(1, direction)
+                    bullets.destroy(b)
+                    break
+
+def update_camera(dt):
+    global camera_transition, transition_timer, cam_x
+    if camera_transition:
+        transition_timer -= dt
+        if transition_timer <= 0:
+            camera_transition = False
+            cam_x = max(0, min(player.rect.centerx - WIDTH // 2, WORLD_WIDTH - WIDTH))
+        else:
+            t = 1 - (transition_timer / 0.5)
+            target_x = max(0, min(player.rect.centerx - WIDTH // 2, WORLD_WIDTH - WIDTH))
+            cam_x = start_cam_x + t * (target_x - start_cam_x)
+    else:
+        cam_x = arena_locked if arena_locked is not None else \
+                max(0, min(player.rect.centerx - WIDTH // 2, WORLD_WIDTH - WIDTH))
+
+def update_world(dt):
+    world.update(cam_x)
+
+SIM_PHASES = (
+    ("arène",    update_arena),
+    ("joueur",   update_player),
+    ("ennemis",  update_enemies),
+    ("balles",   update_bullets),
+    ("caméra",   update_camera),
+    ("monde",    update_world),
+)
+
+def simulate(dt, tick_controls, profiler=None):
+    global controls, prev_cam_x, sim_time, sim_tick
+    if recorder is not None:
+        recorder.record(tick_controls, pending_shots)
+    sim_time += dt * 1000
+    sim_tick += 1
+    controls = tick_controls
+    prev_cam_x = cam_x
+    for p in players():
+        p.prev_pos = p.rect.topleft
+    for e in enemies.items:
+        e.prev_pos = e.rect.topleft
+    if USE_NUMPY:
+        bullets.begin_tick()
+    else:
+        for b in bullets.items:
+            b.prev_pos = b.rect.topleft
+    for name, phase in SIM_PHASES:
+        timed(profiler, name, phase, dt)
+    # Destructions différées appliquées une seule fois, en fin de tick
+    enemies.flush()
+    bullets.flush()
+    if net_host is not None and sim_tick % NET_SNAPSHOT_EVERY == 0:
+        net_host.send_snapshot()
+    if rewind is not None:
+        timed(profiler, "retour", rewind.record)
+
+# ────────────────────────────────────────────────
+# RENDU (interpolé entre deux pas)
+# ────────────────────────────────────────────────
+def draw_background(out, cx):
+    draw_parallax(out, cx)
+    for p, _ in level.near(cx, cx + WIDTH):
+        out.rect(C_PLATFORM, pygame.Rect(p.x - cx, p.y, p.w, p.h))
+
+def draw_entities(out, cx, alpha):
+    if USE_NUMPY:
+        bullets.draw(out, cx, alpha)
+    else:
+        for b in bullets.items:
+            b.draw(out, cx, alpha)
+    for e in enemies.items:
+        e.draw(out, cx, alpha)
+    for p in players():
+        p.draw(out, cx, alpha)
+
+def arena_cleared():
+    return arena_locked and not enemies and not spawner and not pending_waves
+
+def draw_hud(out):
+    hud(out, player.hp, arena_idx, arena_cleared(), show_arrow)
+
+def hud(out, hp, arena, cleared, arrow):  # aussi utilisé par le client co-op
+    out.rect(C_BAR_BG, pygame.Rect(10, 10, 120, 8))
+    out.rect(C_BAR, pygame.Rect(10, 10, int(120 * hp / PLAYER_MAX_HP), 8))
+    out.blit(hud_hp_text.get(f"{hp}/{PLAYER_MAX_HP}"), (10, 22))
+    out.blit(hud_arena_text.get(f"Arène {arena}/{world.arena_count}"), (WIDTH - 170, 10))
+
+    if cleared:
+        out.blit(clear_text, clear_text.get_rect(center=(WIDTH // 2, HEIGHT // 2)).topleft)
+        if arrow:
+            out.blit(arrow_img, (WIDTH - 50, HEIGHT // 2 - 20))
+
+def submit(build, *args):  # remplit la liste de dessin puis la fait exécuter
+    build(draw_list, *args)
+    backend.draw(draw_list)
+
+def render(alpha, profiler=None):
+    cx = prev_cam_x + (cam_x - prev_cam_x) * alpha
+    timed(profiler, "décor", submit, draw_background, cx)
+    timed(profiler, "entités", submit, draw_entities, cx, alpha)
+    timed(profiler, "hud", submit, draw_hud)
+    if PROFILER.overlay:
+        submit(PROFILER.draw_overlay)
+
+# ────────────────────────────────────────────────
+# RENDU PAR RECTANGLES SALES (arène à caméra fixe)
+# ────────────────────────────────────────────────
+# Tant que la caméra est bloquée sur une arène, le décor composé (fond,
+# parallaxe, plateformes) est gardé dans une Surface. Chaque frame on
+# restaure seulement le décor sous les entités et le HUD de la frame
+# précédente, on redessine par-dessus et display.update() ne pousse que ces
+# zones. Caméra qui défile ou en transition : rendu complet + flip().
+class DirtyRectRenderer:
+    def __init__(self):
+        self.background = pygame.Surface((WIDTH, HEIGHT))
+        self.bg_cam = None
+        self.prev_rects = []
+
+    def present(self, alpha, profiler=None):
+        static = (arena_locked is not None and not camera_transition and
+                  prev_cam_x == cam_x)
+        if not static:
+            self.bg_cam = None
+            render(alpha, profiler)
+            timed(profiler, "flip", backend.present)
+            return
+        cx = cam_x
+        if self.bg_cam != cx:
+            timed(profiler, "décor", self.compose, cx)
+            self.bg_cam = cx
+            self.draw_foreground(cx, alpha, profiler)
+            self.prev_rects = self.foreground_rects(cx, alpha)
+            timed(profiler, "flip", backend.present)
+            return
+        timed(profiler, "décor", self.restore, self.prev_rects)
+        self.draw_foreground(cx, alpha, profiler)
+        rects = self.foreground_rects(cx, alpha)
+        timed(profiler, "flip", backend.present, self.prev_rects + rects)
+        self.prev_rects = rects
+
+    def compose(self, cx):
+        draw_background(draw_list, cx)
+        backend.draw(draw_list, self.background)
+        draw_list.blit(self.background, (0, 0))
+        backend.draw(draw_list)
+
+    def restore(self, rects):
+        for r in rects:
+            draw_list.blit(self.background, r, r)
+        backend.draw(draw_list)
+
+    def draw_foreground(self, cx, alpha, profiler):
+        timed(profiler, "entités", submit, draw_entities, cx, alpha)
+        timed(profiler, "hud", submit, draw_hud)
+        if PROFILER.overlay:
+            submit(PROFILER.draw_overlay)
+
+    def foreground_rects(self, cx, alpha):
+        rects = [e.dirty_rect(cx, alpha) for e in enemies.items]
+        rects += (bullets.dirty_rects(cx, alpha) if USE_NUMPY else
+                  [b.dirty_rect(cx, alpha) for b in bullets.items])
+        rects += [p.dirty_rect(cx, alpha) for p in players()]
+        rects.append(pygame.Rect(10, 10, 120, 8))
+        rects.append(hud_hp_text.surf.get_rect(topleft=(10, 22)))
+        rects.append(hud_arena_text.surf.get_rect(topleft=(WIDTH - 170, 10)))
+        if arena_cleared():
+            rects.append(clear_text.get_rect(center=(WIDTH // 2, HEIGHT // 2)))
+            rects.append(pygame.Rect(WIDTH - 50, HEIGHT // 2 - 20, 21, 41))
+        if PROFILER.overlay:
+            rects.append(PROFILER.overlay_rect())
+        return rects
+
+# Le Renderer sdl2 redessine toute la fenêtre : rectangles sales côté "surface" seulement
+dirty_renderer = DirtyRectRenderer() if cli_args.dirty_rects and backend.name == "surface" else None
+
+def present(alpha, profiler=None):
+    if dirty_renderer is not None and quality.scale == 1:
+        dirty_renderer.present(alpha, profiler)
+    else:
+        render(alpha, profiler)
+        timed(profiler, "flip", backend.present)
+
+# ────────────────────────────────────────────────
+# GOUVERNEUR DE QUALITÉ (temps de frame mesuré)
+# ────────────────────────────────────────────────
+# Chaque frame, main() donne la durée rendue par clock.tick() et le travail
+# réel (get_rawtime(), sans l'attente du plafond de FPS). Médiane glissante
+# du temps de frame au-delà du budget : on descend d'un palier. Travail
+# médian bien en deçà : on remonte, mais seulement après un délai doublé à
+# chaque remontée aussitôt suivie d'une descente (pas d'oscillation entre
+# deux paliers). Les paliers ne touchent qu'au rendu, jamais à simulate() :
+# enregistrements et rejeux restent identiques. Du plus discret au plus
+# visible : barres de vie sans zoom et animation espacée hors champ, plans
+# lointains figés (recalés par à-coups), résolution interne réduite puis
+# plans lointains remplacés par leur couleur moyenne.
+FAR_LIVE, FAR_FROZEN, FAR_DROPPED = 0, 1, 2
+QUALITY_TIERS = (
+    # (résolution interne, plans lointains, zoom des barres de vie, animation hors champ tous les n ticks)
+    (1.0,  FAR_LIVE,    True,  1),
+    (1.0,  FAR_LIVE,    False, 4),
+    (1.0,  FAR_FROZEN,  False, 4),
+    (0.5,  FAR_FROZEN,  False, 8),
+    (0.5,  FAR_DROPPED, False, 8),
+)
+QUALITY_WINDOW      = 45     # frames mesurées avant toute décision (la fenêtre repart à chaque palier)
+QUALITY_DOWN        = 1.15   # temps de frame médian / budget : au-delà, palier suivant
+QUALITY_UP          = 0.6    # travail médian / budget : en deçà, palier précédent
+QUALITY_UP_HOLD_MS  = 3000   # délai minimal sur un palier avant de remonter
+QUALITY_UP_HOLD_MAX = 60000
+QUALITY_FAR_FACTOR  = 0.6    # plans de parallaxe plus lents : lointains
+QUALITY_FREEZE_PX   = 32     # plans figés : recalés au-delà de ce décalage
+
+class QualityGovernor:
+    def __init__(self, auto=True):
+        self.auto = auto
+        self.frames = deque(maxlen=QUALITY_WINDOW)
+        self.work = deque(maxlen=QUALITY_WINDOW)
+        self.since = 0.0  # ms passées sur le palier courant
+        self.up_hold = QUALITY_UP_HOLD_MS
+        self.raised = False  # palier courant atteint en remontant
+        self.frozen = None   # (plans lointains, cx, image composée)
+        self.colors = {}     # tuile -> couleur moyenne (plans supprimés)
+        self.set(0)
+
+    def set(self, tier):
+        self.tier = tier
+        self.scale, self.far, self.hit_fx, self.offscreen_anim = QUALITY_TIERS[tier]
+        if not backend.scalable:
+            self.scale = 1.0
+        elif backend.scale != self.scale:
+            backend.set_scale(self.scale)
+        self.frozen = None
+        if dirty_renderer is not None:
+            dirty_renderer.bg_cam = None
+        self.frames.clear()
+        self.work.clear()
+        self.since = 0.0
+
+    def observe(self, frame_ms, work_ms):
+        if not self.auto:
+            return
+        self.frames.append(frame_ms)
+        self.work.append(work_ms)
+        self.since += frame_ms
+        if len(self.frames) < QUALITY_WINDOW:
+            return
+        budget = 1000 / FPS
+        if sorted(self.frames)[QUALITY_WINDOW // 2] > budget * QUALITY_DOWN:
+            if self.tier + 1 < len(QUALITY_TIERS):
+                if self.raised and self.since < self.up_hold:
+                    self.up_hold = min(2 * self.up_hold, QUALITY_UP_HOLD_MAX)
+                self.raised = False
+                self.set(self.tier + 1)
+        elif (self.tier and self.since >= self.up_hold and
+              sorted(self.work)[QUALITY_WINDOW // 2] < budget * QUALITY_UP):
+            self.raised = True
+            self.set(self.tier - 1)
+
+    def backdrop(self, out, cx, layers):
+        # Fond et plans lointains selon le palier ; rend les plans encore à dessiner
+        far = [layer for layer in layers if layer.factor < QUALITY_FAR_FACTOR]
+        if self.far == FAR_LIVE or not far:
+            out.rect(C_BG)
+            return layers
+        near = [layer for layer in layers if layer.factor >= QUALITY_FAR_FACTOR]
+        if self.far == FAR_DROPPED:
+            tile = far[0].tile
+            if tile not in self.colors:
+                self.colors[tile] = tuple(pygame.transform.average_color(tile))[:3]
+            out.rect(self.colors[tile])
+            return near
+        frozen = self.frozen
+        if (frozen is None or frozen[0] != far or
+                max(layer.factor for layer in far) * abs(cx - frozen[1]) >= QUALITY_FREEZE_PX):
+            surf = pygame.Surface((WIDTH, HEIGHT))
+            surf.fill(C_BG)
+            for layer in far:
+                layer.draw(surf, cx)
+            self.frozen = frozen = (far, cx, backend.prepare(surf))
+        out.blit(frozen[2], (0, 0))
+        return near
+
+    def label(self):
+        return f"qualité {self.tier}/{len(QUALITY_TIERS) - 1}" + (" auto" if self.auto else "")
+
+quality = QualityGovernor(auto=not HEADLESS)
+
+def poll_events():
+    global pending_shots
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            pygame.quit(); sys.exit()
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            pending_shots += 1
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_KP0:
+            pending_shots += 1
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            PROFILER.overlay = not PROFILER.overlay
+            PROFILER.enabled = PROFILER.enabled or PROFILER.overlay
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F4 and PROFILER.frames:
+            PROFILER.export_json("beat_profile.json")
+            PROFILER.export_trace("beat_trace.json")
+        if event.type == pygame.KEYDOWN and net_host is None:
+            rewind_key(event.key)
+
+# ────────────────────────────────────────────────
+# CO-OP EN RÉSEAU (UDP)
+# ────────────────────────────────────────────────
+# L'hôte garde la seule simulation ; le client n'envoie que ses entrées,
+# répétées sur les derniers ticks pour survivre aux pertes. L'hôte renvoie
+# 20 instantanés par seconde, quantifiés (pixels entiers, PV en %) et codés
+# en delta par rapport au dernier instantané acquitté par le client : seules
+# les entités apparues, déplacées ou modifiées partent, sur deux octets
+# signés quand le pas est petit. Les balles vont tout droit : elles ne sont
+# envoyées qu'une fois (origine, vitesse, tick de départ) et le client les
+# extrapole. Le client affiche ~100 ms en arrière en interpolant entre les
+# deux instantanés qui encadrent ce moment.
+NET_SNAPSHOT_EVERY   = 3    # ticks entre deux instantanés (20 Hz)
+NET_INPUT_REDUNDANCY = 8    # derniers ticks d'entrée répétés par paquet
+NET_HISTORY          = 64   # instantanés gardés comme bases de delta
+NET_INTERP_TICKS     = 6    # retard d'affichage du client (100 ms)
+NET_MAX_INPUT_LAG    = 10   # entrées client en attente au-delà : on rattrape
+NET_INPUT_EVERY      = 2    # ticks client par paquet d'entrées
+NET_UDP_OVERHEAD     = 28   # en-têtes IP + UDP, comptés dans les débits
+
+PKT_INPUT, PKT_SNAPSHOT = 1, 2
+_NET_INPUT = struct.Struct("<BHHB")        # type, tick client, dernier instantané reçu, nb entrées
+_NET_SNAP  = struct.Struct("<BHHIHBBBBH")  # type, n°, base, tick, caméra, arène, drapeaux, PV j1, PV j2, nb entités
+_NET_ENT   = struct.Struct("<HB")          # id, champs présents
+
+# Une entité : (type, x, y, image, PV en % ou 255 sans barre). Pour une balle :
+# (type, x au tick de départ, y, tick de départ sur 16 bits, vitesse + 128)
+NET_P1, NET_P2, NET_SHOOTER, NET_MELEE, NET_VEHICLE, NET_SHOT_ENEMY, NET_SHOT_PLAYER = range(7)
+NET_KINDS = {ShooterEnemy: NET_SHOOTER, MeleeEnemy: NET_MELEE, VehicleEnemy: NET_VEHICLE}
+F_NEW, F_X, F_Y, F_SMALL, F_LOOK, F_HP = 1, 2, 4, 8, 16, 32
+FLAG_LOCKED, FLAG_CLEARED, FLAG_ARROW = 1, 2, 4
+NO_FRAME = 0xFFFF
+NET_CLIPS = [name for name, _, _ in ANIMATION_SOURCES]
+
+def q16(v):  # coordonnée sur 16 bits signés (un ennemi tombé dans le vide descend sans fin)
+    return -32768 if v < -32768 else 32767 if v > 32767 else v
+
+def seq_newer(a, b):  # numéros sur 16 bits qui rebouclent
+    return a != b and (a - b) & 0xFFFF < 0x8000
+
+_frame_codes = weakref.WeakKeyDictionary()
+
+def frame_code(img):
+    # (clip << 10) | (droite << 9) | image : identique sur les deux machines
+    code = _frame_codes.get(img)
+    if code is None:
+        for ci, name in enumerate(NET_CLIPS):
+            clip = dict.get(ANIMATIONS, name)
+            if clip is not None:
+                for d in (LEFT, RIGHT):
+                    for i, f in enumerate(clip.frames[d]):
+                        _frame_codes[f] = ci << 10 | (d == RIGHT) << 9 | i
+        code = _frame_codes.setdefault(img, NO_FRAME)
+    return code
+
+def frame_image(code):
+    clip = ANIMATIONS[NET_CLIPS[code >> 10]]
+    return clip.frames[RIGHT if code & 0x200 else LEFT][code & 0x1FF]
+
+def net_state():
+    flags = ((arena_locked is not None) * FLAG_LOCKED | bool(arena_cleared()) * FLAG_CLEARED |
+             bool(show_arrow) * FLAG_ARROW)
+    glob = (sim_tick, max(0, int(cam_x)), arena_idx, flags,
+            max(0, player.hp), max(0, partner.hp) if partner else 0)
+    state = {}
+    for kind, p in zip((NET_P1, NET_P2), players()):
+        visible = p.inv == 0 or (p.inv // 4) % 2 == 0
+        state[kind + 1] = (kind, q16(p.rect.x), q16(p.rect.y), (p.facing > 0) | visible << 1, 255)
+    for e in enemies.items:
+        if e.alive:
+            hp = int(100 * e.hp / e.max_hp) if e.hit_timer > 0 else 255
+            state[0x100 + e.handle % 0x7E00] = (NET_KINDS[type(e)], q16(e.rect.x), q16(e.rect.y),
+                                                frame_code(e.img), hp)
+    if USE_NUMPY:
+        idx = np.flatnonzero(bullets.alive[:bullets.top])
+        vx, start = bullets.vx[idx], bullets.start[idx]
+        kind = np.where(bullets.owner[idx] == OWNER_ENEMY, NET_SHOT_ENEMY, NET_SHOT_PLAYER)
+        x0 = bullets.x[idx] - vx * (sim_tick - start)
+        for i, k, x, y, t, v in zip(idx.tolist(), kind.tolist(), x0.tolist(), bullets.y[idx].tolist(),
+                                    start.tolist(), vx.tolist()):
+            state[0x8000 | i & 0x7FFF] = (k, q16(x), q16(y), t & 0xFFFF, v + 128)
+    else:
+        for b in bullets.items:
+            if b.alive:
+                kind = NET_SHOT_ENEMY if b.owner == 'enemy' else NET_SHOT_PLAYER
+                x0 = b.rect.x - b.vx * (sim_tick - b.start)
+                state[0x8000 | b.handle & 0x7FFF] = (kind, q16(x0), q16(b.rect.y), b.start & 0xFFFF, b.vx + 128)
+    return glob, state
+
+def bullet_view(ent, t):
+    # Balle extrapolée au tick (fractionnaire) t, sous la forme des autres entités
+    kind, x0, y, start, v = ent
+    age = (int(t) - start) & 0xFFFF
+    age += t - int(t)
+    vx = v - 128
+    if kind == NET_SHOT_PLAYER:
+        return kind, x0 + vx * age, y, NO_FRAME, 255
+    clip = ANIMATIONS["projectile"]
+    frame = clip.frame_index(int(age * 1000) // SIM_HZ)
+    return kind, x0 + vx * age, y, NET_CLIPS.index("projectile") << 10 | (vx > 0) << 9 | frame, 255
+
+def encode_snapshot(seq, base_seq, glob, state, base):
+    out = bytearray(_NET_SNAP.size)
+    changed = 0
+    for eid, ent in state.items():
+        old = base.get(eid)
+        if old == ent:
+            continue
+        if old is None or old[0] != ent[0]:
+            mask = F_NEW | F_X | F_Y | F_LOOK | F_HP
+        else:
+            dx, dy = ent[1] - old[1], ent[2] - old[2]
+            if (dx or dy) and -128 <= dx < 128 and -128 <= dy < 128:
+                mask = F_SMALL
+            else:
+                mask = (F_X if dx else 0) | (F_Y if dy else 0)
+            mask |= (F_LOOK if ent[3] != old[3] else 0) | (F_HP if ent[4] != old[4] else 0)
+        out += _NET_ENT.pack(eid, mask)
+        if mask & F_NEW:
+            out.append(ent[0])
+        if mask & F_SMALL:
+            out += struct.pack("<bb", dx, dy)
+        if mask & F_X:
+            out += struct.pack("<h", ent[1])
+        if mask & F_Y:
+            out += struct.pack("<h", ent[2])
+        if mask & F_LOOK:
+            out += struct.pack("<H", ent[3])
+        if mask & F_HP:
+            out.append(ent[4])
+        changed += 1
+    gone = [eid for eid in base if eid not in state]
+    out += struct.pack(f"<H{len(gone)}H", len(gone), *gone)
+    _NET_SNAP.pack_into(out, 0, PKT_SNAPSHOT, seq, base_seq, *glob, changed)
+    return bytes(out)
+
+def decode_snapshot(data, bases):
+    _, seq, base_seq, *glob, changed = _NET_SNAP.unpack_from(data)
+    base = bases.get(base_seq) if base_seq else {}
+    if base is None:
+        return None  # base oubliée : on attend le prochain instantané
+    state = dict(base)
+    try:
+        pos = _NET_SNAP.size
+        for _ in range(changed):
+            eid, mask = _NET_ENT.unpack_from(data, pos)
+            pos += _NET_ENT.size
+            kind, x, y, look, hp = (None, 0, 0, NO_FRAME, 255) if mask & F_NEW else state[eid]
+            if mask & F_NEW:
+                kind = data[pos]
+                pos += 1
+            if mask & F_SMALL:
+                dx, dy = struct.unpack_from("<bb", data, pos)
+                x, y = x + dx, y + dy
+                pos += 2
+            if mask & F_X:
+                x, = struct.unpack_from("<h", data, pos)
+                pos += 2
+            if mask & F_Y:
+                y, = struct.unpack_from("<h", data, pos)
+                pos += 2
+            if mask & F_LOOK:
+                look, = struct.unpack_from("<H", data, pos)
+                pos += 2
+            if mask & F_HP:
+                hp = data[pos]
+                pos += 1
+            state[eid] = (kind, x, y, look, hp)
+        n_gone, = struct.unpack_from("<H", data, pos)
+        for eid in struct.unpack_from(f"<{n_gone}H", data, pos + 2):
+            state.pop(eid, None)
+    except (struct.error, KeyError, IndexError):
+        return None  # paquet tronqué ou entité inconnue : on le jette, la base reste intacte
+    return seq, tuple(glob), state
+
+class LossyLink:
+    # Envoi UDP, avec perte, latence et gigue simulées pour les essais en local
+    def __init__(self, sock, latency_ms=0, jitter_ms=0, loss=0.0, clock=time.perf_counter, seed=0):
+        self.sock = sock
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.loss = loss
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.queue = []  # tas de (heure de départ, n°, données, adresse)
+        self.packets = self.dropped = self.bytes = 0
+
+    def send(self, data, addr):
+        self.packets += 1
+        self.bytes += len(data) + NET_UDP_OVERHEAD
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+        elif self.latency or self.jitter:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            heapq.heappush(self.queue, (self.clock() + delay, self.packets, data, addr))
+        else:
+            self.sock.sendto(data, addr)
+
+    def pump(self):
+        now = self.clock()
+        while self.queue and self.queue[0][0] <= now:
+            _, _, data, addr = heapq.heappop(self.queue)
+            self.sock.sendto(data, addr)
+
+    def receive(self):
+        self.pump()
+        while True:
+            try:
+                yield self.sock.recvfrom(65536)
+            except BlockingIOError:
+                return
+            except ConnectionResetError:  # Windows : ICMP « port injoignable »
+                continue
+
+def udp_socket(address):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(address)
+    sock.setblocking(False)
+    return sock
+
+class NetHost:
+    def __init__(self, address, latency_ms=0, jitter_ms=0, loss=0.0, clock=time.perf_counter):
+        self.link = LossyLink(udp_socket(address), latency_ms, jitter_ms, loss, clock, seed=1)
+        self.peer = None
+        self.inputs = deque()    # entrées du client pas encore jouées, une par tick client
+        self.last_input = None   # tick client de la dernière entrée mise en file
+        self.controls = (False, False, False)
+        self.acked = 0           # base des deltas (0 : instantané complet)
+        self.seq = 0
+        self.history = {}        # n° -> état envoyé
+
+    def poll(self):
+        for data, addr in self.link.receive():
+            if len(data) < _NET_INPUT.size or data[0] != PKT_INPUT:
                 continue
-            if not e.update(player):
-                enemies.remove(e)
+            self.peer = addr
+            _, tick, ack, n = _NET_INPUT.unpack_from(data)
+            if ack == 0:  # client (re)parti de zéro
+                self.acked = 0
+            elif ack in self.history and (not self.acked or seq_newer(ack, self.acked)):
+                self.acked = ack
+            first = tick - n + 1
+            for k, bits in enumerate(data[_NET_INPUT.size:_NET_INPUT.size + n]):
+                t = (first + k) & 0xFFFF
+                if self.last_input is None or seq_newer(t, self.last_input):
+                    self.inputs.append(bits)
+                    self.last_input = t
+
+    def next_input(self):
+        self.poll()
+        shots = 0
+        # Rafale après une coupure : on saute des ticks sans perdre les tirs
+        while len(self.inputs) > NET_MAX_INPUT_LAG:
+            shots += self.inputs.popleft() >> 3
+        if self.inputs:
+            bits = self.inputs.popleft()
+            self.controls = (bool(bits & 1), bool(bits & 2), bool(bits & 4))
+            shots += bits >> 3
+        return self.controls, shots
+
+    def send_snapshot(self):
+        self.poll()
+        if self.peer is None:
+            return
+        self.seq = self.seq % 0xFFFF + 1  # 0 réservé : « sans base »
+        glob, state = net_state()
+        base = self.history.get(self.acked)
+        data = encode_snapshot(self.seq, self.acked if base is not None else 0, glob, state, base or {})
+        self.history[self.seq] = state
+        if len(self.history) > NET_HISTORY:
+            del self.history[next(iter(self.history))]
+        self.link.send(data, self.peer)
+
+class NetClient:
+    def __init__(self, host_address, latency_ms=0, jitter_ms=0, loss=0.0, clock=time.perf_counter):
+        self.link = LossyLink(udp_socket(("", 0)), latency_ms, jitter_ms, loss, clock, seed=2)
+        self.host = host_address
+        self.tick = 0
+        self.recent = deque(maxlen=NET_INPUT_REDUNDANCY)
+        self.states = {}          # n° -> état décodé, bases des deltas suivants
+        self.latest = 0
+        self.timeline = deque(maxlen=32)  # (tick hôte, global, état) à interpoler
+        self.view_tick = None     # estimation du tick hôte courant
+        self.received = self.undecodable = 0
+
+    def send_input(self, controls, shots):
+        left, right, jump = controls
+        self.tick = (self.tick + 1) & 0xFFFF
+        self.recent.append(left | right << 1 | jump << 2 | min(shots, 31) << 3)
+        if self.tick % NET_INPUT_EVERY:
+            return
+        self.link.send(_NET_INPUT.pack(PKT_INPUT, self.tick, self.latest, len(self.recent)) +
+                       bytes(self.recent), self.host)
+
+    def poll(self):
+        for data, _ in self.link.receive():
+            if len(data) < _NET_SNAP.size or data[0] != PKT_SNAPSHOT:
                 continue
-            if e.rect.colliderect(player.rect):
-                direction = -1 if e.rect.centerx > player.rect.centerx else 1
-                player.damage(e.dmg, direction)
-
-        for b in bullets[:]:
-            b.update()
-            if b.off_screen():
-                bullets.remove(b)
+            decoded = decode_snapshot(data, self.states)
+            if decoded is None:
+                self.undecodable += 1
                 continue
-            if b.owner == 'player':
-                for e in enemies[:]:
-                    if b.rect.colliderect(e.rect):
-                        e.hp -= 1
-                        e.take_hit()
-                        bullets.remove(b)
-                        if e.hp <= 0:
-                            enemies.remove(e)
-                        break
+            seq, glob, state = decoded
+            self.received += 1
+            self.states[seq] = state
+            if len(self.states) > NET_HISTORY:
+                del self.states[next(iter(self.states))]
+            if self.latest and not seq_newer(seq, self.latest):
+                continue  # arrivé en retard : ne sert que de base
+            self.latest = seq
+            self.timeline.append((glob[0], glob, state))
+
+    def advance(self):  # un tick local : l'horloge d'affichage suit l'hôte en douceur
+        if not self.timeline:
+            return
+        newest = self.timeline[-1][0]
+        if self.view_tick is None or abs(newest - self.view_tick) > SIM_HZ:
+            self.view_tick = float(newest)
+        else:
+            self.view_tick += 1 + (newest - self.view_tick) * 0.05
+
+    def sample(self):
+        if not self.timeline:
+            return None
+        t = self.view_tick - NET_INTERP_TICKS
+        older = newer = None
+        for entry in self.timeline:
+            if entry[0] <= t:
+                older = entry
             else:
-                if b.rect.colliderect(player.rect):
-                    direction = -1 if b.vx > 0 else 1
-                    player.damage(1, direction)
-                    bullets.remove(b)
-
-        if camera_transition:
-            transition_timer -= 1 / FPS
-            if transition_timer <= 0:
-                camera_transition = False
-                cam_x = max(0, min(player.rect.centerx - WIDTH // 2, WORLD_WIDTH - WIDTH))
+                newer = entry
+                break
+        if older is None or newer is None:  # démarrage ou famine : état connu le plus proche
+            older = newer = older or newer
+            a = 0.0
+        else:
+            a = (t - older[0]) / (newer[0] - older[0])
+        glob = newer[1]
+        glob = (glob[0], older[1][1] + (glob[1] - older[1][1]) * a) + glob[2:]
+        ents = {}
+        for eid, ent in newer[2].items():
+            old = older[2].get(eid)
+            if ent[0] >= NET_SHOT_ENEMY:
+                ents[eid] = bullet_view(ent, t)
+            elif old is None or old[0] != ent[0] or abs(ent[1] - old[1]) > 64:  # nouvelle ou téléportée
+                ents[eid] = ent
             else:
-                t = 1 - (transition_timer / 0.5)
-                target_x = max(0, min(player.rect.centerx - WIDTH // 2, WORLD_WIDTH - WIDTH))
-                cam_x = start_cam_x + t * (target_x - start_cam_x)
+                ents[eid] = (ent[0], old[1] + (ent[1] - old[1]) * a, old[2] + (ent[2] - old[2]) * a,
+                             ent[3], ent[4])
+        return glob, ents
+
+_net_sprites = {}
+
+def net_sprite(kind):
+    img = _net_sprites.get(kind)
+    if img is None:
+        if kind in (NET_P1, NET_P2):
+            img = Player(C_PLAYER if kind == NET_P1 else C_PLAYER2).img
         else:
-            cam_x = arena_locked if arena_locked is not None else \
-                    max(0, min(player.rect.centerx - WIDTH // 2, WORLD_WIDTH - WIDTH))
-
-        screen.fill(C_BG)
-        draw_parallax(cam_x)
-
-        for p in platforms:
-            pygame.draw.rect(screen, C_PLATFORM,
-                             (p.x - cam_x, p.y, p.w, p.h))
-
-        for b in bullets:
-            b.draw(cam_x)
-        for e in enemies:
-            e.draw(cam_x)
-        player.draw(cam_x)
-
-        pygame.draw.rect(screen, C_BAR_BG, (10, 10, 120, 8))
-        pygame.draw.rect(screen, C_BAR,
-                         (10, 10, int(120 * player.hp / PLAYER_MAX_HP), 8))
-        screen.blit(font.render(f"{player.hp}/{PLAYER_MAX_HP}",
-                                True, (0, 0, 0)), (10, 22))
-        screen.blit(font.render(f"Arène {arena_idx}/{len(ARENAS)}",
-                                True, (0, 0, 0)), (WIDTH - 170, 10))
-
-        if arena_locked and not enemies and not pending_waves:
-            text = big_font.render("Arène terminée !", True, (255, 255, 255))
-            text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            screen.blit(text, text_rect)
-            if show_arrow:
-                pygame.draw.polygon(screen, C_ARROW,
-                                    [(WIDTH - 50, HEIGHT // 2),
-                                     (WIDTH - 30, HEIGHT // 2 - 20),
-                                     (WIDTH - 30, HEIGHT // 2 + 20)])
+            img = block_img(C_VEHICLE)
+        img = _net_sprites[kind] = img
+    return img
 
-        pygame.display.flip()
+def draw_net_view(out, view):
+    glob, ents = view
+    cx = glob[1]
+    draw_background(out, cx)
+    # Balles, puis ennemis, puis joueurs : même ordre que draw_entities
+    for kind, x, y, look, hp in sorted(ents.values(), key=lambda ent: -ent[0]):
+        x -= cx
+        if kind <= NET_P2:
+            if look & 2:
+                out.blit(net_sprite(kind), (x, y))
+            continue
+        if look != NO_FRAME:
+            img = frame_image(look)
+        elif kind == NET_SHOT_PLAYER:
+            img = player_bullet_img()
+        else:
+            img = net_sprite(kind)
+        out.blit(img, (x, y))
+        if hp != 255:
+            w = img.get_width()
+            out.blit(hit_bar(w, w * hp // 100, 1.0), (x, y - 18))
+    _, _, arena, flags, _, hp = glob
+    hud(out, hp, arena, flags & FLAG_CLEARED, flags & FLAG_ARROW)
+
+waiting_text = CachedText(font, (255, 255, 255))
+
+def draw_net_waiting(out):
+    out.rect(C_BG)
+    label = waiting_text.get("Connexion à l'hôte…")
+    out.blit(label, label.get_rect(center=(WIDTH // 2, HEIGHT // 2)).topleft)
+
+def coop_script(tick):
+    # Partenaire scripté (banc réseau) : suit l'hôte et tire toutes les 10 frames
+    dx = player.rect.centerx - partner.rect.centerx
+    return (dx < -80, dx > 80, tick % 150 == 0), int(tick % 10 == 0)
+
+def run_net_harness(ticks=3600, seed=0, latency_ms=80, jitter_ms=20, loss=0.05):
+    # Hôte et client dans le même processus, sur 127.0.0.1, horloge = temps simulé
+    global net_host, pending_shots
+    sim_clock = lambda: sim_time / 1000
+    net_host = NetHost(("127.0.0.1", 0), latency_ms, jitter_ms, loss, sim_clock)
+    client = NetClient(net_host.link.sock.getsockname(), latency_ms, jitter_ms, loss, sim_clock)
+    reset_game(seed)
+    player.immortal = True
+    per_second = []
+    checked = mismatches = 0
+    last_checked = 0
+    t0 = time.perf_counter()
+    for tick in range(ticks):
+        left, right, jump, fire = bot_script(tick) if enemies else push_right_script(tick)
+        if fire:
+            pending_shots += 1
+        client.send_input(*coop_script(tick))
+        simulate(SIM_DT, (left, right, jump))
+        client.poll()
+        client.advance()
+        client.sample()
+        # Chaque état reconstruit doit être exactement celui envoyé par l'hôte
+        if client.latest != last_checked and client.latest in net_host.history:
+            last_checked = client.latest
+            checked += 1
+            mismatches += client.states[client.latest] != net_host.history[client.latest]
+        if (tick + 1) % SIM_HZ == 0:
+            per_second.append(net_host.link.bytes)
+    elapsed = time.perf_counter() - t0
+    rates = [b - a for a, b in zip([0] + per_second, per_second)]
+    down, up = net_host.link, client.link
+    print(f"co-op en local : {ticks} ticks, latence {latency_ms:g} ms (+{jitter_ms:g}), perte {loss:.0%}, "
+          f"{ticks / elapsed:.0f} ticks/s")
+    print(f"  hôte → client : {down.bytes / len(rates) / 1024:.2f} Ko/s en moyenne, "
+          f"{max(rates) / 1024:.2f} Ko/s au pire, {down.packets} instantanés dont {down.dropped} perdus")
+    print(f"  client → hôte : {up.bytes / len(rates) / 1024:.2f} Ko/s, {up.packets} paquets dont {up.dropped} perdus")
+    print(f"  instantanés décodés {client.received}, sans base {client.undecodable}, "
+          f"vérifiés {checked}, divergents {mismatches}")
+    print(f"  arène atteinte {arena_idx}/{world.arena_count}, ennemis max vus par le client "
+          f"{max((sum(1 for e in s.values() if NET_SHOOTER <= e[0] <= NET_VEHICLE) for s in client.states.values()), default=0)}")
+    net_host = None
+    return mismatches
+
+# ────────────────────────────────────────────────
+# RETOUR ARRIÈRE (instantanés compacts)
+# ────────────────────────────────────────────────
+# capture_frame() réduit tout l'état que simulate() fait évoluer à quelques
+# chaînes d'octets : en-tête (globales, joueurs, vagues, file d'apparition),
+# RNG, puis une table de lignes de taille fixe pour les ennemis et une pour
+# les balles, chacune avec la liste de ses clés (identifiant, ou case du pool
+# NumPy et numéro de tir). Une balle va tout droit : sa ligne garde son
+# origine et sa durée de vie de départ, et ne change plus jusqu'à sa
+# disparition. Les images ne sont que des codes frame_code(), retrouvés au
+# chargement dans l'atlas partagé. RewindBuffer garde les dernières secondes :
+# une image clé par demi-seconde, puis à chaque tick le XOR avec le tick
+# précédent, octet par octet (un retrait ne déplace qu'une ligne, la dernière,
+# qui prend sa place), passé à zlib. Le plus ancien part au-delà de la durée
+# ou du budget d'octets ; revenir à un tick décode au plus une demi-seconde
+# (moins d'une frame à 1000 ennemis). La capture coûte à peu près 3 µs par
+# ennemi : au-delà de REWIND_STRIDE_ENEMIES ennemis, chaque groupe n'en garde
+# qu'un tick sur `stride` (images clés espacées d'autant), et un retour tombe
+# sur le tick capturé précédent.
+REWIND_SECONDS        = 10
+REWIND_KEYFRAME_EVERY = SIM_HZ // 2      # ticks entre deux images clés
+REWIND_BUDGET         = 4 * 1024 * 1024  # octets, tous tampons compris
+REWIND_STRIDE_ENEMIES = 100              # ennemis par tick sauté entre deux captures
+
+_RW_NUM    = struct.Struct("<?d")  # nombre rendu avec son type (les empreintes distinguent 0 et 0.0)
+_RW_HEAD   = struct.Struct("<II" + "?d" * 9 + "Hi??H???IIIIiiBBH")
+_RW_PLAYER = struct.Struct("<iiiidd?biH?")
+_RW_QUEUED = struct.Struct("<B?dbdI?d")
+_RW_ENEMY  = struct.Struct("<BiiHHiiiihddd??HbdIBdddHiH")
+_RW_SHOT   = struct.Struct("<iihHHiIB")  # x d'origine, y, vx, w, h, vie d'origine, tick de départ, camp
+_RW_PART   = struct.Struct("<BI")
+RW_SAME, RW_XOR, RW_RAW = 0, 1, 2
+RW_NO_TARGET = -2 ** 31
+RW_PARTS = 7  # en-tête, RNG, clés et lignes des ennemis, des balles, cases libérées du pool
+RW_KINDS = (ShooterEnemy, MeleeEnemy, VehicleEnemy)
+CLIP_CODES = {name: i for i, name in enumerate(NET_CLIPS)}
+SHOOTER_STATE_CODES = {state: i for i, state in enumerate(EnemyBatch.SHOOTER_STATES)}
+if USE_NUMPY:
+    RW_SHOT_DTYPE = np.dtype([("x0", "<i4"), ("y", "<i4"), ("vx", "<i2"), ("w", "<u2"), ("h", "<u2"),
+                              ("life0", "<i4"), ("start", "<u4"), ("owner", "u1")])
+    RW_ENEMY_DTYPE = np.dtype([(name, fmt) for name, fmt in zip(
+        ("kind", "x", "y", "w", "h", "prev_x", "prev_y", "max_hp", "hp", "dmg", "vel_y", "hit_timer",
+         "hit_scale", "on_ground", "routed", "ai_ticks", "dir", "speed", "s_interval", "aux",
+         "last_shot", "last_jump", "attack_timer", "clip", "anim_start", "frame"),
+        ("u1", "<i4", "<i4", "<u2", "<u2", "<i4", "<i4", "<i4", "<i4", "<i2", "<f8", "<f8",
+         "<f8", "?", "?", "<u2", "i1", "<f8", "<u4", "u1", "<f8", "<f8", "<f8", "<u2", "<i4", "<u2"))])
+    assert RW_ENEMY_DTYPE.itemsize == _RW_ENEMY.size
+    # Colonnes d'EnemyBatch recopiées telles quelles (KIND_* suit l'ordre de RW_KINDS)
+    RW_BATCH_COLUMNS = ("kind", "x", "y", "w", "h", "vel_y", "hit_timer", "hit_scale", "on_ground",
+                        "routed", "dir", "speed", "s_interval", "last_shot", "last_jump", "attack_timer")
+    RW_OBJECT_COLUMNS = ("prev_x", "prev_y", "max_hp", "hp", "dmg", "ai_ticks", "aux", "clip",
+                         "anim_start", "frame")
+
+def _num(v):
+    return (True, v) if type(v) is int else (False, math.nan if v is None else v)
+
+def _unnum(is_int, v):
+    return int(v) if is_int else None if v != v else v
+
+def _keys(handles):
+    return struct.pack(f"<{len(handles)}I", *handles)
+
+def _xor(a, b):  # `b` tronqué ou complété de zéros à la longueur de `a`
+    b = b[:len(a)]
+    if np is None:  # entiers de Python : ~40 fois plus lent sur les grandes tables
+        return (int.from_bytes(a, "little") ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+    out = np.frombuffer(a, dtype=np.uint8).copy()
+    out[:len(b)] ^= np.frombuffer(b, dtype=np.uint8)
+    return out.tobytes()
+
+def _player_row(p):
+    return _RW_PLAYER.pack(p.rect.x, p.rect.y, *p.prev_pos, p.vel.x, p.vel.y, p.on_ground,
+                           p.facing, p.hp, p.inv, p.immortal)
+
+def _load_player(p, row):
+    x, y, px, py, vx, vy, p.on_ground, p.facing, p.hp, p.inv, p.immortal = row
+    p.rect.topleft = (x, y)
+    p.prev_pos = (px, py)
+    p.vel.update(vx, vy)
+
+_rw_frames = {}  # image de l'atlas -> frame_code(), sans passer par le dictionnaire faible
+
+def _rw_frame(img):
+    code = _rw_frames.get(img)
+    if code is None:
+        code = _rw_frames[img] = frame_code(img)
+    return code
+
+# Une fonction par type : une seule écriture par ennemi et par tick
+def _shooter_row(e):
+    anim = e.anim
+    return _RW_ENEMY.pack(0, *e.rect, *e.prev_pos, e.max_hp, e.hp, e.dmg, e.vel_y, e.hit_timer,
+                          e.hit_scale, e.on_ground, e.routed, e.ai_ticks, e.dir, e.speed, e.s_interval,
+                          SHOOTER_STATE_CODES[e.state], e.last_shot, e.last_jump, e.attack_timer,
+                          CLIP_CODES[anim.clip.name], anim.start, _rw_frame(e.img))
+
+def _melee_row(e):
+    anim = e.anim
+    return _RW_ENEMY.pack(1, *e.rect, *e.prev_pos, e.max_hp, e.hp, e.dmg, e.vel_y, e.hit_timer,
+                          e.hit_scale, e.on_ground, e.routed, e.ai_ticks, e.facing, e.speed, 0,
+                          e.skin | e.moving << 1, 0, e.last_jump, 0,
+                          CLIP_CODES[anim.clip.name], anim.start, _rw_frame(e.img))
+
+def _vehicle_row(e):
+    return _RW_ENEMY.pack(2, *e.rect, *e.prev_pos, e.max_hp, e.hp, e.dmg, e.vel_y, e.hit_timer,
+                          e.hit_scale, e.on_ground, e.routed, e.ai_ticks, 0, e.speed, 0, 0, 0, 0, 0, 0, 0, 0)
+
+ENEMY_ROWS = {ShooterEnemy: _shooter_row, MeleeEnemy: _melee_row, VehicleEnemy: _vehicle_row}
+
+# NumPy : le reste de la ligne, seul à vivre dans les objets
+def _shooter_extra(e):
+    anim = e.anim
+    return (*e.prev_pos, e.max_hp, e.hp, e.dmg, e.ai_ticks, SHOOTER_STATE_CODES[e.state],
+            CLIP_CODES[anim.clip.name], anim.start, _rw_frame(e.img))
+
+def _melee_extra(e):
+    anim = e.anim
+    return (*e.prev_pos, e.max_hp, e.hp, e.dmg, e.ai_ticks,
+            e.skin | e.moving << 1,
+            CLIP_CODES[anim.clip.name], anim.start, _rw_frame(e.img))
+
+def _vehicle_extra(e):
+    return (*e.prev_pos, e.max_hp, e.hp, e.dmg, e.ai_ticks, 0, 0, 0, 0)
+
+ENEMY_EXTRAS = {ShooterEnemy: _shooter_extra, MeleeEnemy: _melee_extra, VehicleEnemy: _vehicle_extra}
+
+def _enemy_rows_np(store):
+    # Sans sync_objects : les champs tenus par EnemyBatch sont lus en bloc
+    cols = store.columns
+    rows = np.empty(cols.n, dtype=RW_ENEMY_DTYPE)
+    for name in RW_BATCH_COLUMNS:
+        rows[name] = getattr(cols, name)[:cols.n]
+    extra = np.array([ENEMY_EXTRAS[type(e)](e) for e in store.items], dtype=np.int64).reshape(-1, len(RW_OBJECT_COLUMNS))
+    for k, name in enumerate(RW_OBJECT_COLUMNS):
+        rows[name] = extra[:, k]
+    return rows.tobytes()
+
+def _load_enemy(row):
+    (kind, x, y, w, h, px, py, max_hp, hp, dmg, vel_y, hit_timer, hit_scale, on_ground, routed,
+     ai_ticks, look, speed, s_interval, aux, last_shot, last_jump, attack_timer,
+     clip, anim_start, frame) = row
+    e = enemy_pool.acquire(RW_KINDS[kind])
+    e.rect.update(x, y, w, h)
+    e.prev_pos = (px, py)
+    e.max_hp, e.hp, e.dmg = max_hp, hp, dmg
+    e.vel_y, e.hit_timer, e.hit_scale = vel_y, hit_timer, hit_scale
+    e.on_ground, e.routed, e.ai_ticks = on_ground, routed, ai_ticks
+    if kind == 2:
+        e.speed = int(speed)
+        e.img = block_img(C_VEHICLE)
+        return e
+    e.speed = speed
+    e.last_jump = last_jump
+    e.anim.clip = ANIMATIONS[NET_CLIPS[clip]]
+    e.anim.start = anim_start
+    e.img = frame_image(frame)
+    if kind == 0:
+        e.dir, e.s_interval, e.state = look, s_interval, EnemyBatch.SHOOTER_STATES[aux]
+        e.last_shot, e.attack_timer = last_shot, attack_timer
+    else:
+        e.facing, e.moving = look, bool(aux & 2)
+        e.set_skin(aux & 1)
+    return e
+
+_shot_rows = weakref.WeakKeyDictionary()  # Bullet -> ligne, fixe pour toute sa vie
+
+def _bullet_row(b):
+    row = _shot_rows.get(b)
+    if row is None:
+        age = sim_tick - b.start
+        row = _shot_rows[b] = _RW_SHOT.pack(b.rect.x - b.vx * age, b.rect.y, b.vx, b.rect.w, b.rect.h,
+                                            b.life + age, b.start, b.owner == 'enemy')
+    return row
+
+def _load_bullet(handle, row):
+    x0, y, vx, w, h, life0, start, enemy = row
+    age = sim_tick - start
+    b = Bullet.__new__(Bullet)
+    b.handle, b.vx, b.owner, b.start, b.life = handle, vx, 'enemy' if enemy else 'player', start, life0 - age
+    b.rect = pygame.Rect(x0 + vx * age, y, w, h)
+    b.prev_pos = (b.rect.x - vx, y)
+    if enemy:
+        b.dir = RIGHT if vx > 0 else LEFT
+        b.anim = Animator(ANIMATIONS["projectile"])
+        b.anim.start = start
+        b.img = b.anim.frame(b.dir)
+    else:
+        b.img = player_bullet_img()
+    return b
+
+_rng_part = [None, b""]  # dernier état du RNG et son codage : la plupart des ticks n'y touchent pas
+
+def capture_frame():
+    state = rng.getstate()
+    if state != _rng_part[0]:
+        version, words, gauss = state
+        _rng_part[:] = [state, struct.pack(f"<B{len(words)}I", version, *words) + _RW_NUM.pack(*_num(gauss))]
+    target = ((nav.surfaces[nav.target][2], nav.surfaces[nav.target][0]) if nav.target is not None
+              else (RW_NO_TARGET, 0))
+    bounds = arena_bounds or (None, None)
+    parts = [b""] * RW_PARTS
+    parts[2] = _keys([e.handle for e in enemies.items])
+    if enemies.columns is not None:
+        parts[3] = _enemy_rows_np(enemies)
+    else:
+        parts[3] = b"".join([ENEMY_ROWS[type(e)](e) for e in enemies.items])
+    if USE_NUMPY:
+        idx = np.flatnonzero(bullets.alive[:bullets.top])
+        age = sim_tick - bullets.start[idx]
+        rows = np.empty(len(idx), dtype=RW_SHOT_DTYPE)
+        rows["x0"] = bullets.x[idx] - bullets.vx[idx] * age
+        rows["life0"] = bullets.life[idx] + age
+        for name in ("y", "vx", "w", "h", "start"):
+            rows[name] = getattr(bullets, name)[idx]
+        rows["owner"] = bullets.owner[idx] == OWNER_ENEMY
+        parts[4] = np.stack([idx, bullets.seq[idx]], axis=1).astype("<u4").tobytes()  # case, seq
+        parts[5] = rows.tobytes()
+        # La free-list commence par les cases jamais servies (>= top) : seul le reste est gardé
+        parts[6] = np.array(bullets.free[bullets.capacity - bullets.top:], dtype="<u4").tobytes()
+        shots = (bullets.next_seq, bullets.top)
+    else:
+        parts[4] = _keys([b.handle for b in bullets.items])
+        parts[5] = b"".join([_bullet_row(b) for b in bullets.items])
+        shots = (bullets._next_handle, 0)
+    nums = []
+    for v in (sim_time, cam_x, prev_cam_x, start_cam_x, transition_timer, non_arena_spawn_timer,
+              arena_locked, *bounds):
+        nums += _num(v)
+    head = [_RW_HEAD.pack(sim_tick, game_seed, *nums, arena_idx, clear_timer, show_arrow,
+                          camera_transition, pending_shots, *controls, enemies._next_handle, *shots,
+                          ai_scheduler.cursor, *target, len(players()), len(pending_waves), len(spawner))]
+    head += [_player_row(p) for p in players()]
+    head += [bytes((w["s"], w["m"], w["v"])) for w in pending_waves]
+    for cls, x, direction, rolled, now in spawner.queue:
+        kind = RW_KINDS.index(cls)
+        speed, extra = rolled if kind < 2 else (0, rolled)  # vitesse + intervalle de tir ou skin
+        head.append(_RW_QUEUED.pack(kind, *_num(x), direction, speed, extra, *_num(now)))
+    parts[0] = b"".join(head)
+    parts[1] = _rng_part[1]
+    return tuple(parts)
+
+def encode_frame(frame, base=None):
+    # Sans base : image clé. Sinon chaque partie est omise ou XORée avec celle de la base
+    out = []
+    for part, ref in zip(frame, base or (None,) * RW_PARTS):
+        if ref is None:
+            out += [_RW_PART.pack(RW_RAW, len(part)), part]
+        elif part == ref:
+            out.append(_RW_PART.pack(RW_SAME, 0))
+        else:
+            out += [_RW_PART.pack(RW_XOR, len(part)), _xor(part, ref)]
+    # Fenêtre de 4 Ko, mémoire réduite : zlib.compress() en prépare 256 Ko à chaque appel
+    z = zlib.compressobj(1, zlib.DEFLATED, 12, 4)
+    return z.compress(b"".join(out)) + z.flush()
+
+def decode_frame(blob, base=None):
+    data = zlib.decompress(blob)
+    frame = []
+    pos = 0
+    for i in range(RW_PARTS):
+        how, n = _RW_PART.unpack_from(data, pos)
+        pos += _RW_PART.size
+        part = data[pos:pos + n]
+        pos += n
+        if how == RW_SAME:
+            part = base[i]
+        elif how == RW_XOR:
+            part = _xor(part, base[i])
+        frame.append(part)
+    return tuple(frame)
+
+def apply_frame(frame):
+    global sim_tick, game_seed, sim_time, cam_x, prev_cam_x, start_cam_x, transition_timer
+    global non_arena_spawn_timer, arena_locked, arena_bounds, arena_idx, clear_timer, show_arrow
+    global camera_transition, pending_shots, controls, pending_waves
+    head, rng_part, enemy_keys, enemy_rows, shot_keys, shot_rows, free = frame
+    fields = _RW_HEAD.unpack_from(head)
+    sim_tick, game_seed = fields[:2]
+    (sim_time, cam_x, prev_cam_x, start_cam_x, transition_timer, non_arena_spawn_timer,
+     arena_locked, low, high) = (_unnum(*fields[k:k + 2]) for k in range(2, 20, 2))
+    arena_bounds = None if low is None else (low, high)
+    (arena_idx, clear_timer, show_arrow, camera_transition, pending_shots, left, right, jump,
+     enemy_next, shot_next, top, ai_scheduler.cursor, target_top, target_left,
+     n_players, n_waves, n_queued) = fields[20:]
+    controls = (left, right, jump)
+    pos = _RW_HEAD.size
+    for p in players()[:n_players]:
+        _load_player(p, _RW_PLAYER.unpack_from(head, pos))
+        pos += _RW_PLAYER.size
+    pos += _RW_PLAYER.size * max(0, n_players - len(players()))
+    pending_waves = [dict(zip("smv", head[pos + 3 * k:pos + 3 * k + 3])) for k in range(n_waves)]
+    pos += 3 * n_waves
+    spawner.cancel()
+    for kind, x_int, x, direction, speed, extra, now_int, now in _RW_QUEUED.iter_unpack(head[pos:]):
+        rolled = (speed, extra) if kind < 2 else extra
+        spawner.queue.append((RW_KINDS[kind], _unnum(x_int, x), direction, rolled, _unnum(now_int, now)))
+
+    version, *words = struct.unpack_from(f"<B{(len(rng_part) - 10) // 4}I", rng_part)
+    rng.setstate((version, tuple(words), _unnum(*_RW_NUM.unpack_from(rng_part, len(rng_part) - 9))))
+
+    enemies.clear()  # les ennemis actuels retournent au pool avant d'en ressortir
+    handles = struct.unpack(f"<{len(enemy_keys) // 4}I", enemy_keys)
+    loaded = []
+    for handle, row in zip(handles, _RW_ENEMY.iter_unpack(enemy_rows)):
+        e = _load_enemy(row)
+        e.handle = handle
+        loaded.append(e)
+    enemies.load(loaded, enemy_next)
+    if USE_NUMPY:
+        rows = np.frombuffer(shot_rows, dtype=RW_SHOT_DTYPE)
+        keys = np.frombuffer(shot_keys, dtype="<u4").astype(np.int64).reshape(-1, 2)
+        age = sim_tick - rows["start"].astype(np.int64)
+        x = rows["x0"] + rows["vx"] * age
+        bullets.load(keys[:, 0], {"x": x, "y": rows["y"], "prev_x": x - rows["vx"], "prev_y": rows["y"],
+                                  "vx": rows["vx"], "w": rows["w"], "h": rows["h"],
+                                  "life": rows["life0"] - age, "start": rows["start"], "seq": keys[:, 1]},
+                     np.where(rows["owner"], OWNER_ENEMY, OWNER_PLAYER),
+                     np.frombuffer(free, dtype="<u4").tolist(), top, shot_next)
+    else:
+        handles = struct.unpack(f"<{len(shot_keys) // 4}I", shot_keys)
+        bullets.load([_load_bullet(h, row) for h, row in zip(handles, _RW_SHOT.iter_unpack(shot_rows))],
+                     shot_next)
+
+    world.update(cam_x)
+    nav.sync()
+    nav.target = None
+    for left, right, sid in nav.by_top.get(target_top, ()):
+        if left == target_left:
+            nav.target = sid
+    if dirty_renderer is not None:
+        dirty_renderer.bg_cam = None
+    if recorder is not None:
+        del recorder.ticks[sim_tick:]
+
+def save_state():
+    return encode_frame(capture_frame())
+
+def load_state(blob):
+    apply_frame(decode_frame(blob))
+
+class RewindBuffer:
+    def __init__(self, seconds=REWIND_SECONDS, budget=REWIND_BUDGET, keyframe_every=REWIND_KEYFRAME_EVERY):
+        self.max_ticks = int(seconds * SIM_HZ)
+        self.budget = budget
+        self.keyframe_every = keyframe_every
+        # (tick de l'image clé, pas, [image clé, deltas des ticks start + k * pas])
+        self.groups = deque()
+        self.size = 0
+        self.last = None       # dernier état capturé : base du prochain delta
+        self.next = None       # tick attendu au prochain record()
+
+    def clear(self):
+        self.groups.clear()
+        self.size = 0
+        self.last = None
+        self.next = None
+
+    def first(self):
+        return self.groups[0][0] if self.groups else None
+
+    def latest(self):  # dernier tick capturé
+        start, stride, blobs = self.groups[-1]
+        return start + (len(blobs) - 1) * stride
+
+    def record(self):
+        if self.groups and sim_tick != self.next:
+            self.clear()  # nouvelle partie ou état chargé d'ailleurs
+        self.next = sim_tick + 1
+        start, stride, blobs = self.groups[-1] if self.groups else (None, 1, None)
+        # Image clé toutes les keyframe_every captures : même coût de retour quel que soit le pas
+        if blobs is None or sim_tick - start >= self.keyframe_every * stride:
+            frame = capture_frame()
+            blob = encode_frame(frame)
+            self.groups.append((sim_tick, 1 + len(enemies) // REWIND_STRIDE_ENEMIES, [blob]))
+        else:
+            if (sim_tick - start) % stride:
+                return
+            frame = capture_frame()
+            blob = encode_frame(frame, self.last)
+            blobs.append(blob)
+        self.size += len(blob)
+        self.last = frame
+        while len(self.groups) > 1 and (self.size > self.budget or
+                                        sim_tick - self.groups[1][0] >= self.max_ticks):
+            self.size -= sum(map(len, self.groups.popleft()[2]))
+
+    def frame_at(self, tick):
+        # État du dernier tick capturé <= `tick`, avec ce tick
+        for start, stride, blobs in reversed(self.groups):
+            if start <= tick:
+                count = min(len(blobs), (tick - start) // stride + 1)
+                frame = decode_frame(blobs[0])
+                for blob in blobs[1:count]:
+                    frame = decode_frame(blob, frame)
+                return frame, start + (count - 1) * stride
+        raise ValueError(f"tick {tick} hors du tampon")
+
+    def rewind(self, tick):
+        # Revient à `tick` (borné au plus ancien) ; la suite du tampon est jetée
+        frame, tick = self.frame_at(min(max(tick, self.first()), self.latest()))
+        apply_frame(frame)
+        while self.groups[-1][0] > tick:
+            self.size -= sum(map(len, self.groups.pop()[2]))
+        start, stride, blobs = self.groups[-1]
+        keep = (tick - start) // stride + 1
+        self.size -= sum(map(len, blobs[keep:]))
+        del blobs[keep:]
+        self.last = frame
+        self.next = tick + 1
+        return tick
+
+rewind = None       # RewindBuffer, actif en jeu (--rewind)
+quick_save = None   # F5 / F9
+arena_save = None   # (n° d'arène, état à son entrée) : F8 recommence l'arène
+
+def checkpoint_arena():
+    global arena_save
+    if arena_locked is not None and (arena_save is None or arena_save[0] != arena_idx):
+        arena_save = (arena_idx, save_state())
+
+def restore(blob):
+    load_state(blob)
+    if rewind is not None:  # l'historique repart de l'état chargé
+        rewind.clear()
+        rewind.record()
+
+def rewind_key(key):
+    global quick_save
+    if key == pygame.K_F5:
+        quick_save = save_state()
+    elif key == pygame.K_F9 and quick_save is not None:
+        restore(quick_save)
+    elif key == pygame.K_F8 and arena_save is not None:
+        restore(arena_save[1])
+    elif key == pygame.K_BACKSPACE and rewind is not None and rewind.groups:
+        rewind.rewind(sim_tick - SIM_HZ)
+
+# ────────────────────────────────────────────────
+# BOUCLE PRINCIPALE ASYNC
+# ────────────────────────────────────────────────
+async def main():
+    accumulator = 0.0
+    while True:
+        frame_ms = clock.tick(FPS)
+        accumulator += frame_ms / 1000
+        quality.observe(frame_ms, clock.get_rawtime())
+        profiler = PROFILER if PROFILER.enabled else None
+        if profiler:
+            profiler.begin_frame()
+
+        timed(profiler, "événements", poll_events)
+
+        steps = 0
+        while accumulator >= SIM_DT and steps < MAX_SIM_STEPS:
+            simulate(SIM_DT, keyboard_controls(), profiler)
+            accumulator -= SIM_DT
+            steps += 1
+        if steps == MAX_SIM_STEPS:
+            # Trop de retard : on abandonne le reste plutôt que de rattraper sans fin
+            accumulator = min(accumulator, SIM_DT)
+        if net_host is None:
+            checkpoint_arena()
+
+        present(accumulator / SIM_DT, profiler)
+        if profiler:
+            profiler.end_frame()
         await asyncio.sleep(0)
 
+async def client_main(net):
+    # Client co-op : pas de simulation, seulement entrées sortantes et instantanés
+    accumulator = 0.0
+    shots = 0
+    while True:
+        frame_ms = clock.tick(FPS)
+        accumulator += frame_ms / 1000
+        quality.observe(frame_ms, clock.get_rawtime())
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit(); sys.exit()
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                shots += 1
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_KP0:
+                shots += 1
+        steps = 0
+        while accumulator >= SIM_DT and steps < MAX_SIM_STEPS:
+            net.send_input(keyboard_controls(), shots)
+            shots = 0
+            net.poll()
+            net.advance()
+            accumulator -= SIM_DT
+            steps += 1
+        if steps == MAX_SIM_STEPS:
+            accumulator = min(accumulator, SIM_DT)
+
+        view = net.sample()
+        if view is None:
+            submit(draw_net_waiting)
+        else:
+            world.update(view[0][1])
+            submit(draw_net_view, view)
+        backend.present()
+        await asyncio.sleep(0)
+
+# ────────────────────────────────────────────────
+# MODE SANS FENÊTRE & BANCS D'ESSAI
+# ────────────────────────────────────────────────
+# Même simulate()/render()/present que main(), sans attente : `script`
+# donne pour chaque tick (gauche, droite, saut, tir).
+def idle_script(tick):
+    return False, False, False, False
+
+def run_headless(ticks, seed=0, script=idle_script, setup=None, profiler=None):
+    global pending_shots
+    reset_game(seed)
+    if setup:
+        setup()
+    for tick in range(ticks):
+        left, right, jump, fire = script(tick)
+        if fire:
+            pending_shots += 1
+        if profiler:
+            profiler.begin_frame()
+        simulate(SIM_DT, (left, right, jump), profiler)
+        render(1.0, profiler)
+        timed(profiler, "flip", backend.present)
+        if profiler:
+            profiler.end_frame()
+
+def patrol_script(tick):
+    # Va-et-vient de 2 s en tirant toutes les 8 frames
+    going_right = (tick // 120) % 2 == 0
+    return not going_right, going_right, tick % 90 == 0, tick % 8 == 0
+
+def push_right_script(tick):
+    return False, True, False, tick % 4 == 0
+
+def horde(n):
+    def setup():
+        player.immortal = True
+        third = n // 3
+        spawn_wave({"s": third, "m": n - 2 * third, "v": third}, 0, WIDTH)
+        spawner.flush()
+    return setup
+
+def offscreen_horde():
+    # Grosse vague qui attend hors champ d'entrer en scène
+    player.immortal = True
+    spawn_wave({"s": 300, "m": 400, "v": 0}, WIDTH + 600, WORLD_WIDTH - 600)
+    spawner.flush()
+
+def bullet_storm(shooters=40, interval=100):
+    def setup():
+        player.immortal = True
+        spawn_wave({"s": shooters, "m": 0, "v": 0}, 0, WIDTH)
+        spawner.flush()
+        for e in enemies.view(ShooterEnemy):
+            e.s_interval = interval
+            if enemies.columns is not None:
+                enemies.columns.set_shot_interval(enemies.index_of(e), interval)
+    return setup
+
+def arena_clear():
+    player.immortal = True
+
+BENCH_SCENARIOS = {
+    "ennemis_10":    (horde(10), patrol_script),
+    "ennemis_100":   (horde(100), patrol_script),
+    "ennemis_1000":  (horde(1000), patrol_script),
+    "hors_champ":    (offscreen_horde, patrol_script),
+    "pluie_de_balles": (bullet_storm(), patrol_script),
+    "enfer_de_balles": (bullet_storm(400, 50), patrol_script),
+    "arene_complete":  (arena_clear, push_right_script),
+}
+
+def replay(log, profiler=None, draw=True):
+    global pending_shots
+    lod, ai_scheduler.lod = ai_scheduler.lod, log.ai_lod  # réglage de l'enregistrement
+    reset_game(log.seed)
+    try:
+        for tick_controls, shots in log:
+            if profiler:
+                profiler.begin_frame()
+            pending_shots = shots
+            simulate(SIM_DT, tick_controls, profiler)
+            if draw:
+                render(1.0, profiler)
+                timed(profiler, "flip", backend.present)
+            if profiler:
+                profiler.end_frame()
+        return state_digest()
+    finally:
+        ai_scheduler.lod = lod
+
+RENDER_PHASES = ("décor", "entités", "hud", "flip")
+
+def run_benchmarks(names=None, ticks=600, seed=0, replays=()):
+    phases = ([phase for phase, _ in SIM_PHASES] + (["retour"] if rewind is not None else []) +
+              list(RENDER_PHASES))
+    print(f"rendu : {backend.name}")
+    print(f"{'scénario':<18}{'ticks/s':>10}   " +
+          "  ".join(f"{name:>8}" for name in phases) + "   (ms/tick)")
+    PROFILER.enabled = True
+    recorded = []
+
+    def measure(label, n, run):
+        PROFILER.frames = deque(maxlen=n)
+        t0 = time.perf_counter()
+        note = run()
+        elapsed = time.perf_counter() - t0
+        totals = PROFILER.totals()
+        print(f"{label:<18}{n / elapsed:>10.1f}   " +
+              "  ".join(f"{totals.get(phase, 0.0) / n:>8.3f}" for phase in phases) +
+              (f"   {note}" if note else ""))
+        recorded.extend(PROFILER.frames)
+
+    for name in BENCH_SCENARIOS if names is None else names:
+        setup, script = BENCH_SCENARIOS[name]
+        measure(name, ticks, lambda: run_headless(ticks, seed, script, setup, PROFILER))
+    for path in replays:
+        log = InputLog.load(path)
+        digests = []
+        def run():
+            digests.append(replay(log, PROFILER))
+            if log.digest is None:
+                return digests[0]
+            return "identique" if digests[0] == log.digest else f"DIVERGENCE ({digests[0]} ≠ {log.digest})"
+        measure(os.path.basename(path), len(log.ticks), run)
+        if np is not None and os.environ.get("BEAT_CROSS_ENGINE", "1") == "1":
+            engine = "python" if USE_NUMPY else "numpy"
+            print(f"{'  moteur ' + engine:<18}   {replay_other_engine(path, log.digest or digests[0])}")
+    PROFILER.frames = deque(recorded)
+
+def replay_other_engine(path, digest):
+    # Rejoue dans un processus à part avec l'autre moteur (ennemis et balles) :
+    # les deux doivent aboutir à la même empreinte
+    cmd = [sys.executable, os.path.abspath(__file__), "--replay", path]
+    if cli_args.level:
+        cmd += ["--level", cli_args.level]
+    if not USE_NUMPY:
+        cmd.append("--numpy")
+    env = dict(os.environ)
+    env.pop("BEAT_NUMPY", None)
+    env["BEAT_CROSS_ENGINE"] = "0"  # le rejeu fils ne relance pas le premier moteur
+    done = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if done.returncode:
+        return "non comparable : " + done.stderr.strip().rpartition("error: ")[2]
+    row = done.stdout.strip().rpartition("\n")[2]
+    if "identique" in row or digest in row:
+        return "identique"
+    if "DIVERGENCE" in row:
+        return row[row.index("DIVERGENCE"):]
+    return f"DIVERGENCE ({row.split()[-1]} ≠ {digest})"
+
+# ────────────────────────────────────────────────
+# ÉQUILIBRAGE DES VAGUES (Monte-Carlo, multi-processus)
+# ────────────────────────────────────────────────
+# Chaque tâche rejoue une arène d'ARENAS, vagues éventuellement mises à
+# l'échelle et constantes SHO_/MEL_/VEH_ surchargées, avec un bot à la place
+# du joueur. Les tâches sont indépendantes (graine propre, aucun état partagé)
+# et réparties par paquets sur un ProcessPoolExecutor : le débit suit le
+# nombre de cœurs. Chaque processus ne renvoie que ses mesures par vague.
+BALANCE_TUNABLES = {name: value for name, value in globals().items()
+                    if name.startswith(("SHO_", "MEL_", "VEH_"))}
+
+def bot_script(tick):
+    # Vise l'ennemi le plus proche, garde ses distances, saute les balles
+    if not enemies:
+        return False, False, False, False
+    px = player.rect.centerx
+    target = min(enemies, key=lambda e: abs(e.rect.centerx - px))
+    dx = target.rect.centerx - px
+    side = 1 if dx > 0 else -1
+    if abs(dx) < 120:
+        step = -side
+    elif abs(dx) > 240 or player.facing != side:
+        step = side
+    else:
+        step = 0
+    threat = any(b.owner == 'enemy' and abs(b.rect.centerx - px) < 120 and
+                 (b.rect.centerx - px) * b.vx < 0 for b in bullets)
+    # Acculé contre un bord : on saute par-dessus
+    cornered = step and arena_bounds and (player.rect.left <= arena_bounds[0] + 5 or
+                                          player.rect.right >= arena_bounds[1] - 5)
+    fire = player.facing == side and tick % 6 == 0
+    return step < 0, step > 0, bool(threat or cornered) and player.on_ground, fire
+
+def scale_wave(wave, scale):
+    return {kind: max(0, round(count * scale)) for kind, count in wave.items()}
+
+def balance_run(job):
+    global pending_shots, cam_x, prev_cam_x, arena_idx
+    index, waves, overrides, seed, max_ticks, draw = job
+    globals().update(BALANCE_TUNABLES)
+    globals().update(overrides)
+    nav.build()  # portées de saut et marches selon les constantes surchargées
+    reset_game(seed)
+    player.immortal = True
+    # Le joueur est posé à l'entrée de l'arène, dont on remplace les vagues
+    arena = ARENAS[index]
+    player.rect.midbottom = (arena["x"], GROUND_TOP)
+    player.prev_pos = player.rect.topleft
+    cam_x = prev_cam_x = max(0, min(arena["x"] - WIDTH // 2, WORLD_WIDTH - WIDTH))
+    arena_idx = index
+    world.update(cam_x)
+    world.arenas[index] = dict(world.arena(index), waves=waves)
+
+    # Par vague : ticks, dégâts, morts, pic d'ennemis, pic de balles, coûts (ms)
+    stats = [[0, 0, 0, 0, 0, []] for _ in waves]
+    prev_hp = player.hp
+    cleared = False
+    for tick in range(max_ticks):
+        left, right, jump, fire = bot_script(tick)
+        if fire:
+            pending_shots += 1
+        t0 = time.perf_counter()
+        simulate(SIM_DT, (left, right, jump))
+        if draw:
+            render(1.0)
+        cost = 1000 * (time.perf_counter() - t0)
+        wave = stats[len(waves) - len(pending_waves) - 1]
+        wave[0] += 1
+        if player.hp < prev_hp:
+            wave[1] += prev_hp - player.hp
+        elif player.hp > prev_hp:  # mort : immortal a remis les PV au max
+            wave[1] += prev_hp
+            wave[2] += 1
+        prev_hp = player.hp
+        wave[3] = max(wave[3], len(enemies))
+        wave[4] = max(wave[4], len(bullets))
+        wave[5].append(cost)
+        if not enemies and not spawner and not pending_waves:
+            cleared = True
+            break
+    return cleared, [(t, dmg, deaths, pe, pb, sum(c) / len(c) if c else 0.0, max(c, default=0.0))
+                     for t, dmg, deaths, pe, pb, c in stats]
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def run_balance(runs=100, scales=(1.0,), overrides=None, workers=None, seed=0,
+                max_ticks=60 * SIM_HZ, draw=False, budget_ms=1000 * SIM_DT, json_path=None):
+    overrides = overrides or {}
+    keys, jobs = [], []
+    for index, arena in enumerate(ARENAS):
+        for scale in scales:
+            waves = [scale_wave(w, scale) for w in arena["waves"]]
+            for r in range(runs):
+                keys.append((index, scale))
+                jobs.append((index, waves, overrides, seed + r, max_ticks, draw))
+    workers = workers or os.cpu_count() or 1
+    # Un processus forké n'hérite pas des threads de décodage : tout terminer avant
+    assets.load(list(assets.pending))
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(balance_run, jobs, chunksize=max(1, len(jobs) // (8 * workers))))
+    elapsed = time.perf_counter() - t0
+
+    groups = {}
+    for key, job, (cleared, waves) in zip(keys, jobs, results):
+        group = groups.setdefault(key, {"waves": job[1], "runs": 0, "cleared": 0, "stats": []})
+        group["runs"] += 1
+        group["cleared"] += cleared
+        group["stats"].append(waves)
+
+    report = []
+    print(f"{len(jobs)} parties en {elapsed:.1f} s sur {workers} processus "
+          f"({len(jobs) / elapsed:.1f} parties/s)")
+    print(f"{'arène':>5} {'échelle':>7} {'vague':>5}  {'s/m/v':<8}{'nettoyée':>9}"
+          f"{'durée s (p90)':>15}{'dégâts (p90)':>14}{'morts':>7}{'pic ennemis':>12}"
+          f"{'pic balles':>11}{'ms/tick (max)':>15}")
+    for (index, scale), group in groups.items():
+        for w, wave in enumerate(group["waves"]):
+            rows = [stats[w] for stats in group["stats"] if stats[w][0]]
+            durations = [r[0] * SIM_DT for r in rows]
+            damage = [r[1] for r in rows]
+            entry = {
+                "arena": index + 1, "scale": scale, "wave": w + 1, "composition": wave,
+                "runs": group["runs"], "cleared": group["cleared"] / group["runs"],
+                "duration_s": sum(durations) / len(rows) if rows else 0.0,
+                "duration_p90_s": _percentile(durations, 0.9),
+                "damage": sum(damage) / len(rows) if rows else 0.0,
+                "damage_p90": _percentile(damage, 0.9),
+                "deaths": sum(r[2] for r in rows) / len(rows) if rows else 0.0,
+                "peak_enemies": max((r[3] for r in rows), default=0),
+                "peak_bullets": max((r[4] for r in rows), default=0),
+                "cost_ms": sum(r[5] for r in rows) / len(rows) if rows else 0.0,
+                "cost_max_ms": max((r[6] for r in rows), default=0.0),
+            }
+            report.append(entry)
+            over = " !" if entry["cost_max_ms"] > budget_ms else ""
+            print(f"{index + 1:>5} {scale:>7.2f} {w + 1:>5}  "
+                  f"{'/'.join(str(wave[k]) for k in 'smv'):<8}{entry['cleared']:>9.0%}"
+                  f"{entry['duration_s']:>8.1f} ({entry['duration_p90_s']:>4.1f})"
+                  f"{entry['damage']:>7.1f} ({entry['damage_p90']:>4})"
+                  f"{entry['deaths']:>7.2f}{entry['peak_enemies']:>12}{entry['peak_bullets']:>11}"
+                  f"{entry['cost_ms']:>8.3f} ({entry['cost_max_ms']:>5.2f}){over}")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"runs": runs, "overrides": overrides, "budget_ms": budget_ms,
+                       "draw": draw, "waves": report}, f, indent=1)
+    return report
+
 # ────────────────────────────────────────────────
 # LANCEMENT
 # ────────────────────────────────────────────────
@@ -666,4 +4209,95 @@ if platform.system() == "Emscripten":
     asyncio.ensure_future(main())
 else:
     if __name__ == "__main__":
-        asyncio.run(main())
\ No newline at end of file
+        bench_option.help = f"bancs d'essai ({', '.join(BENCH_SCENARIOS)})"
+        parser.add_argument("--ticks", type=int, default=600)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--profile-json", metavar="FICHIER",
+                            help="durées par frame et compteurs en JSON")
+        parser.add_argument("--trace", metavar="FICHIER", help="trace Chrome (chrome://tracing)")
+        parser.add_argument("--scales", default="1", metavar="1,1.5,2",
+                            help="facteurs appliqués aux vagues d'ARENAS")
+        parser.add_argument("--set", action="append", default=[], metavar="NOM=VALEUR",
+                            help=f"surcharge une constante ({', '.join(BALANCE_TUNABLES)})")
+        parser.add_argument("--jobs", type=int, help="processus (défaut : nombre de cœurs)")
+        parser.add_argument("--balance-render", action="store_true",
+                            help="inclut le rendu dans le coût mesuré par tick")
+        parser.add_argument("--balance-json", metavar="FICHIER", help="rapport d'équilibrage en JSON")
+        parser.add_argument("--quality", metavar="PALIER",
+                            help=f"rendu : auto (défaut en jeu, selon le temps de frame) ou palier fixe "
+                                 f"0-{len(QUALITY_TIERS) - 1} (0 : complet)")
+        parser.add_argument("--rewind", type=float, metavar="SECONDES",
+                            help=f"secondes gardées pour revenir en arrière (touche Retour arrière : -1 s, "
+                                 f"F5/F9 : sauvegarde rapide, F8 : recommencer l'arène ; "
+                                 f"défaut {REWIND_SECONDS} en jeu, 0 sinon)")
+        parser.add_argument("--host", type=int, metavar="PORT", help="co-op : héberge la partie (UDP)")
+        parser.add_argument("--join", metavar="HÔTE:PORT", help="co-op : rejoint une partie hébergée")
+        parser.add_argument("--net-latency", type=float, default=0, metavar="MS",
+                            help="latence simulée à l'envoi (--net-test : 80 par défaut)")
+        parser.add_argument("--net-jitter", type=float, default=0, metavar="MS", help="gigue simulée à l'envoi")
+        parser.add_argument("--net-loss", type=float, default=0, metavar="%", help="perte de paquets simulée")
+        args = parser.parse_args()
+        for path in args.replay or ():
+            try:
+                InputLog.load(path)
+            except (OSError, ValueError) as exc:
+                parser.error(str(exc))
+        if args.record and (args.host or args.join):
+            parser.error("--record : les entrées du partenaire ne sont pas enregistrées")
+        link = (args.net_latency, args.net_jitter, args.net_loss / 100)
+        if args.quality == "auto":
+            quality.auto = True
+        elif args.quality is not None:
+            if args.quality not in [str(tier) for tier in range(len(QUALITY_TIERS))]:
+                parser.error(f"--quality : auto ou 0-{len(QUALITY_TIERS) - 1}")
+            quality.auto = False
+            quality.set(int(args.quality))
+        if args.rewind is None:
+            args.rewind = 0 if HEADLESS or args.host or args.join else REWIND_SECONDS
+        if args.rewind > 0:
+            rewind = RewindBuffer(args.rewind)
+        if args.host:
+            net_host = NetHost(("", args.host), *link)
+            reset_game(args.seed if args.headless else None)
+        if args.profile_json or args.trace:
+            PROFILER.enabled = True
+            PROFILER.frames = deque(maxlen=max(args.ticks, PROFILER.frames.maxlen))
+        if args.record:
+            if args.headless:
+                reset_game(args.seed)
+            recorder = InputLog(game_seed)
+        try:
+            if args.export_level:
+                write_level(args.export_level, *default_level())
+            elif args.balance:
+                overrides = {}
+                for item in args.set:
+                    name, _, value = item.partition("=")
+                    if name not in BALANCE_TUNABLES:
+                        parser.error(f"constante inconnue : {name}")
+                    overrides[name] = json.loads(value.replace("(", "[").replace(")", "]"))
+                run_balance(args.balance, [float(x) for x in args.scales.split(",")], overrides,
+                            args.jobs, args.seed, draw=args.balance_render,
+                            json_path=args.balance_json)
+            elif args.net_test:
+                run_net_harness(args.ticks if args.ticks != 600 else 3600, args.seed,
+                                args.net_latency or 80, args.net_jitter or 20, args.net_loss / 100 or 0.05)
+            elif args.join:
+                address, _, port = args.join.rpartition(":")
+                asyncio.run(client_main(NetClient((socket.gethostbyname(address or "127.0.0.1"), int(port)), *link)))
+            elif args.bench is not None or args.replay:
+                scenarios = (args.bench or None) if args.bench is not None else []
+                run_benchmarks(scenarios, args.ticks, args.seed, args.replay or ())
+            elif args.headless:
+                run_headless(args.ticks, args.seed, patrol_script,
+                             profiler=PROFILER if PROFILER.enabled else None)
+            else:
+                asyncio.run(main())
+        finally:
+            if recorder is not None:
+                recorder.digest = state_digest()
+                recorder.save(args.record)
+            if args.profile_json and PROFILER.frames:  # en jeu, on ne sort que par sys.exit()
+                PROFILER.export_json(args.profile_json)
+            if args.trace and PROFILER.frames:
+                PROFILER.export_trace(args.trace)
\ No newline at end of file